@@ -0,0 +1,130 @@
+# Importing modules...
+import time
+import numpy as np
+import cv2
+
+from modules.vision.blob_detection import *
+
+def marker_image(resolution, markers, radius, rng):
+    # Bright circular markers over a dark background
+    image = np.zeros(resolution[::-1], dtype=np.uint8)
+    
+    margin = 2 * radius
+    centers = rng.uniform((margin, margin), (resolution[0] - margin, resolution[1] - margin), size=(markers, 2))
+
+    for center in centers:
+        # Subpixel center with 8 fractional bits
+        cv2.circle(image, tuple(np.round(center * 256).astype(int)), radius * 256, 255, -1, cv2.LINE_AA, shift=8)
+
+    return image, centers
+
+def match_error(detected_blobs, centers):
+    if not len(detected_blobs):
+        return np.nan
+    
+    # Distance from each true center to its closest detection
+    distances = np.linalg.norm(centers[:, None, :] - detected_blobs[None, :, :2], axis=2)
+
+    return float(np.max(np.min(distances, axis=1)))
+
+def benchmark_blob_detection(resolutions=((256, 256), (1280, 720), (1080, 1080)),
+                             backends=('simple', 'connected'),
+                             markers=4, 
+                             radius=6, # Marker radius in pixels
+                             frames=50,
+                             seed=0):
+    
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for resolution in resolutions:
+        images = [marker_image(resolution, markers, radius, rng) for _ in range(frames)]
+
+        for backend in backends:
+            start = time.perf_counter()
+
+            detections = [detect_blobs(image, area=True, backend=backend) for image, _ in images]
+
+            latency = (time.perf_counter() - start) / frames
+
+            errors = [match_error(detected_blobs, centers) for detected_blobs, (_, centers) in zip(detections, images)]
+
+            results.append({'resolution': resolution,
+                            'backend': backend,
+                            'latency': latency,
+                            'detected': float(np.mean([len(d) for d in detections])),
+                            'max_error': float(np.nanmax(errors))})
+
+    return results
+
+def moving_marker_images(resolution, markers, radius, frames, speed, rng):
+    # Markers drifting at a constant velocity, bouncing on the image borders
+    margin = 2 * radius
+    lower, upper = np.array((margin, margin)), np.array((resolution[0] - margin, resolution[1] - margin))
+
+    centers = rng.uniform(lower, upper, size=(markers, 2))
+    velocities = rng.uniform(-speed, speed, size=(markers, 2))
+
+    images = []
+    for _ in range(frames):
+        image = np.zeros(resolution[::-1], dtype=np.uint8)
+
+        for center in centers:
+            cv2.circle(image, tuple(np.round(center * 256).astype(int)), radius * 256, 255, -1, cv2.LINE_AA, shift=8)
+
+        images.append(image)
+
+        centers = centers + velocities
+        bounced = (centers < lower) | (centers > upper)
+        velocities[bounced] *= -1
+        centers = np.clip(centers, lower, upper)
+
+    return images
+
+def benchmark_blob_tracking(resolution=(1080, 1080), 
+                            markers=4, 
+                            radius=6, # Marker radius in pixels
+                            speed=3, # Maximum marker speed in pixels per frame
+                            frames=200,
+                            seed=0):
+    
+    rng = np.random.default_rng(seed)
+    images = moving_marker_images(resolution, markers, radius, frames, speed, rng)
+
+    # Full scan of every frame
+    start = time.perf_counter()
+    full_detections = [detect_blobs_connected(image, area=True) for image in images]
+    full_latency = (time.perf_counter() - start) / frames
+
+    # Windowed search around the predicted markers
+    tracker = BlobTracker(blob_count=markers)
+
+    start = time.perf_counter()
+    tracked_detections = [tracker.detect(image, area=True) for image in images]
+    tracked_latency = (time.perf_counter() - start) / frames
+
+    identical = all(np.array_equal(full, tracked) for full, tracked in zip(full_detections, tracked_detections))
+
+    return {'resolution': resolution,
+            'full_latency': full_latency,
+            'tracked_latency': tracked_latency,
+            'full_scans': tracker.full_scans,
+            'identical': identical}
+
+if __name__ == '__main__':
+    print('[BENCHMARK] Blob detection latency per frame')
+
+    for result in benchmark_blob_detection():
+        print(f'\t{result["resolution"][0]:>4}x{result["resolution"][1]:<4} - '
+              f'{result["backend"]:>9}: {result["latency"] * 1e3:8.3f} ms, '
+              f'{result["detected"]:.2f} blobs, '
+              f'centroid error {result["max_error"]:.3f} px')
+
+    print('[BENCHMARK] Blob tracking latency per frame')
+
+    result = benchmark_blob_tracking()
+    print(f'\t{result["resolution"][0]:>4}x{result["resolution"][1]:<4} - '
+          f'full scan: {result["full_latency"] * 1e3:.3f} ms, '
+          f'tracked: {result["tracked_latency"] * 1e3:.3f} ms '
+          f'({result["full_scans"]} full scans), '
+          f'identical output: {result["identical"]}')
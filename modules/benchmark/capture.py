@@ -0,0 +1,268 @@
+# Importing modules...
+import argparse
+import itertools
+import platform
+import subprocess
+import select
+import socket
+import json
+import time
+import numpy as np
+
+from modules.integration.client import Client
+from modules.integration.coppeliasim.server import CoppeliaSim_Server
+from modules.integration.coppeliasim.camera import CoppeliaSim_Camera
+from modules.integration.synthetic.emulator import ClientEmulator
+from modules.integration.synthetic.simulation import AnalyticSimulation
+from modules.vision.centroid_noise import CentroidNoiseModel
+from modules.vision.epipolar_geometry import epiline_order
+from modules.vision.synchronizer import Synchronizer, interpolation_methods
+
+# Stages of the capture loop, in processing order
+stages = ('recvfrom', 'lookup', 'decode', 'undistort', 'add_data', 'correspondence', 'triangulation')
+
+def ring_cameras(n_cameras, resolution=(1080, 1080), radius=3, height=2.5, fov_degrees=60, snr_dB=20):
+    # Cameras spread uniformly in a circle around the arena, looking at its center
+    cameras = []
+
+    for ID in range(n_cameras):
+        angle = 2 * np.pi * ID / n_cameras
+        position = np.array([radius * np.cos(angle), radius * np.sin(angle), height])
+
+        # Z axis towards the center, X axis horizontal
+        z = -position / np.linalg.norm(position)
+        x = np.cross(z, [0, 0, 1])
+        x /= np.linalg.norm(x)
+        y = np.cross(z, x)
+
+        pose = np.eye(4)
+        pose[:3, :3] = np.column_stack((x, y, z))
+        pose[:3, 3] = position
+
+        cameras.append(CoppeliaSim_Camera(resolution=resolution, fov_degrees=fov_degrees, pose=pose, snr_dB=snr_dB))
+
+    return cameras
+
+def marker_trajectory(n_markers, n_timesteps, rate, seed=0):
+    # Markers circling the arena center at different heights and phases
+    rng = np.random.default_rng(seed)
+
+    t = np.arange(n_timesteps)[:, None] / rate
+    phases = rng.uniform(0, 2 * np.pi, n_markers)
+    heights = np.linspace(0.5, 1.5, n_markers)
+
+    return np.stack((0.5 * np.cos(t + phases), 
+                     0.5 * np.sin(t + phases), 
+                     np.broadcast_to(heights, (n_timesteps, n_markers))), axis=-1)
+
+def percentiles(latencies):
+    # Latency percentiles in microseconds
+    if not latencies:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None}
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1e-3, (50, 95, 99))
+
+    return {'count': len(latencies), 'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+def benchmark_capture(n_cameras=4,
+                      n_markers=3,
+                      rate=100, # Messages per second of each client
+                      duration=2, # Capture time in seconds
+                      throughput=20, # Triangulated scenes per second
+                      server_address=('127.0.0.1', 18888),
+                      noise_model=None,
+                      interpolation='scipy', # Synchronizer interpolation method
+                      seed=0):
+
+    cameras = ring_cameras(n_cameras)
+    trajectory = marker_trajectory(n_markers, int(duration * rate), rate, seed)
+
+    server = CoppeliaSim_Server(clients=[Client(camera=camera) for camera in cameras],
+                                server_address=server_address)
+    server.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 24)
+
+    step = 1 / throughput
+
+    for client in server.clients:
+        client.synchronizer = Synchronizer(n_markers, 3, step, duration, interpolation=interpolation)
+
+    emulator = ClientEmulator(cameras, trajectory,
+                              server_address=server_address,
+                              rate=rate,
+                              simulation=AnalyticSimulation(cameras, noise_model=noise_model, seed=seed),
+                              seed=seed)
+
+    latencies = {stage: [] for stage in stages}
+    end_to_end = [] # From the arrival of the message completing a synchronized PTS to its triangulation
+    received, triangulated = 0, 0
+
+    with emulator:
+        emulator.start()
+        server.register_clients()
+
+        # Same triangulation index logic as the capture loop of the virtual arena
+        T, T_ = 0, 0
+        max_T = int(duration * throughput - 1)
+        step_delay = 2
+
+        start, last_arrival = None, None
+        clock = time.perf_counter_ns
+
+        while True:
+            # Waiting for the next datagram is not part of the recvfrom cost
+            readable, _, _ = select.select([server.udp_socket], [], [], 1)
+
+            if not readable:
+                break
+
+            t_0 = clock()
+            message_bytes, address = server.udp_socket.recvfrom(server.buffer_size)
+            t_1 = clock()
+
+            latencies['recvfrom'].append(t_1 - t_0)
+
+            # Arrival time of the message, as read by the server
+            start = t_1 if start is None else start
+            last_arrival = t_1
+
+            ID, duplicate = server.identify(message_bytes, address)
+
+            if ID is None or duplicate:
+                continue
+
+            t_2 = clock()
+            latencies['lookup'].append(t_2 - t_1)
+
+            blob_centroids, PTS = server.decode_message(message_bytes, n_markers)
+
+            t_3 = clock()
+            latencies['decode'].append(t_3 - t_2)
+
+            if PTS is None:
+                continue
+
+            received += 1
+            T_idx = int(np.rint(PTS / step))
+            T_ = T_ if T_idx < T_ else max_T if T_idx > max_T else T_idx
+
+            if T_ - T > step_delay:
+                T = T_
+
+            if blob_centroids is None:
+                continue
+
+            undistorted_blobs = server.clients[ID].camera.undistort_points(blob_centroids)
+
+            t_4 = clock()
+            latencies['undistort'].append(t_4 - t_3)
+
+            server.clients[ID].synchronizer.add_data(undistorted_blobs, PTS)
+
+            t_5 = clock()
+            latencies['add_data'].append(t_5 - t_4)
+
+            synchronizers = [client.synchronizer for client in server.clients]
+            available = [ID for ID, S in enumerate(synchronizers) if np.any(S.sync_blobs[T] >= 0)]
+
+            if len(available) < 2:
+                continue
+
+            reference = available[-1]
+            success = False
+
+            for auxiliary in available[:-1]:
+                t_6 = clock()
+
+                blobs_pair = [synchronizers[reference].sync_blobs[T],
+                              epiline_order(synchronizers[reference].sync_blobs[T],
+                                            synchronizers[auxiliary].sync_blobs[T],
+                                            server.multiple_view.fundamental_matrix[reference][auxiliary])]
+
+                t_7 = clock()
+                latencies['correspondence'].append(t_7 - t_6)
+
+                triangulated_markers = server.multiple_view.triangulate_by_pair((reference, auxiliary), blobs_pair, order=False)
+
+                latencies['triangulation'].append(clock() - t_7)
+
+                if not np.isnan(triangulated_markers).any():
+                    end_to_end.append(clock() - t_1)
+                    success = True
+                    triangulated += 1
+                    break
+
+            if not success and len(available) < len(server.clients):
+                continue
+
+            T = max_T if T + 1 > max_T else T + 1
+
+        # Wall time from the first to the last message
+        elapsed = (last_arrival - start) * 1e-9 if start is not None else np.nan
+
+        statistics = emulator.join()
+
+    server.udp_socket.close()
+
+    return {'n_cameras': n_cameras,
+            'n_markers': n_markers,
+            'rate': rate,
+            'duration': duration,
+            'sent': statistics.get('sent', 0),
+            'received': received,
+            'triangulated': triangulated,
+            'throughput': received / elapsed if elapsed > 0 else None, # Messages per second
+            'latency_us': {stage: percentiles(latencies[stage]) for stage in stages},
+            'end_to_end_us': percentiles(end_to_end)}
+
+def environment():
+    # Context needed to compare results across commits and machines
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'commit': commit,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor()}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end capture benchmark with emulated clients')
+    parser.add_argument('--cameras', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--markers', type=int, nargs='+', default=[1, 3])
+    parser.add_argument('--rates', type=int, nargs='+', default=[50, 100])
+    parser.add_argument('--duration', type=float, default=2)
+    parser.add_argument('--port', type=int, default=18888)
+    parser.add_argument('--interpolation', choices=interpolation_methods, default='scipy')
+    parser.add_argument('--output', default='benchmark_capture.json')
+    arguments = parser.parse_args()
+
+    # Centroid noise is calibrated once for the whole sweep
+    noise_model = CentroidNoiseModel()
+
+    results = []
+
+    print('[BENCHMARK] Capture loop latency per stage (p50/p95/p99 in us)')
+
+    for n_cameras, n_markers, rate in itertools.product(arguments.cameras, arguments.markers, arguments.rates):
+        result = benchmark_capture(n_cameras, n_markers, rate, arguments.duration,
+                                   server_address=('127.0.0.1', arguments.port),
+                                   noise_model=noise_model,
+                                   interpolation=arguments.interpolation)
+        results.append(result)
+
+        print(f'\t{n_cameras} cameras, {n_markers} markers, {rate} Hz - '
+              f'{result["received"]}/{result["sent"]} messages, {result["throughput"]:.0f} messages/s, '
+              f'{result["triangulated"]} triangulations')
+
+        for stage, latency in list(result['latency_us'].items()) + [('end-to-end', result['end_to_end_us'])]:
+            if latency['count']:
+                print(f'\t\t{stage:>14}: {latency["p50"]:8.1f} {latency["p95"]:8.1f} {latency["p99"]:8.1f}')
+
+    with open(arguments.output, 'w') as file:
+        json.dump({'environment': environment(), 'results': results}, file, indent=4)
+
+    print(f'[BENCHMARK] Results saved to {arguments.output}')
@@ -0,0 +1,66 @@
+# Importing modules...
+import time
+import numpy as np
+
+from modules.integration.coppeliasim.camera import CoppeliaSim_Camera
+from modules.integration.coppeliasim.pipeline import CoppeliaSim_Pipeline
+from modules.benchmark.blob_detection import marker_image
+from modules.vision.blob_detection import detect_blobs
+
+def benchmark_pipeline(n_cameras=4,
+                       resolution=(1080, 1080),
+                       markers=4,
+                       radius=6, # Marker radius in pixels
+                       snr_dB=30,
+                       steps=20,
+                       seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    cameras = [CoppeliaSim_Camera(vision_sensor_handle=handle,
+                                  resolution=resolution,
+                                  distortion_model='rational',
+                                  distortion_coefficients=np.array([-0.1, 0.01, 0, 0, 0]),
+                                  snr_dB=snr_dB) for handle in range(n_cameras)]
+
+    # Build the distortion maps beforehand
+    for camera in cameras:
+        camera.remap_maps
+
+    # Stand-in for sim.getVisionSensorImg, serving pre-rendered buffers
+    images = [marker_image(resolution, markers, radius, rng)[0] for _ in range(n_cameras)]
+
+    def api_method(handle, grayscale):
+        return images[handle].tobytes(), resolution
+
+    # Serial reference, camera after camera
+    start = time.perf_counter()
+
+    for _ in range(steps):
+        [detect_blobs(camera.get_image(api_method)) for camera in cameras]
+
+    serial_latency = (time.perf_counter() - start) / steps
+
+    # Concurrent pipeline
+    with CoppeliaSim_Pipeline(cameras) as pipeline:
+        start = time.perf_counter()
+
+        for _ in range(steps):
+            pipeline.step(api_method)
+
+        pipeline_latency = (time.perf_counter() - start) / steps
+
+    return {'n_cameras': n_cameras,
+            'resolution': resolution,
+            'serial_latency': serial_latency,
+            'pipeline_latency': pipeline_latency}
+
+if __name__ == '__main__':
+    print('[BENCHMARK] Image pipeline latency per simulation step')
+
+    for n_cameras in (1, 2, 4):
+        result = benchmark_pipeline(n_cameras=n_cameras)
+
+        print(f'\t{result["n_cameras"]} cameras at {result["resolution"][0]}x{result["resolution"][1]} - '
+              f'serial: {result["serial_latency"] * 1e3:.3f} ms, '
+              f'pipeline: {result["pipeline_latency"] * 1e3:.3f} ms')
@@ -0,0 +1,46 @@
+# Importing modules...
+import time
+import numpy as np
+
+from modules.vision.camera import Camera
+from modules.vision.linear_projection import build_intrinsic_matrix
+from modules.integration.synthetic.rasterizer import MarkerRasterizer
+
+def benchmark_rasterizer(resolution=(1920, 1080),
+                         markers=4,
+                         frames=200,
+                         marker_radius=0.02, # In meters
+                         seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    # Camera 3 m away from the origin, looking at it
+    extrinsic_matrix = np.eye(4)
+    extrinsic_matrix[2, 3] = 3
+
+    camera = Camera(resolution=resolution,
+                    intrinsic_matrix=build_intrinsic_matrix(fov_degrees=60, resolution=resolution),
+                    extrinsic_matrix=extrinsic_matrix)
+
+    # Markers wandering around the origin
+    trajectory = np.cumsum(rng.normal(0, 0.005, size=(frames, markers, 3)), axis=0) + rng.uniform(-0.5, 0.5, size=(1, markers, 3))
+
+    rasterizer = MarkerRasterizer([camera], marker_radius=marker_radius)
+    images = np.empty((frames,) + camera.image_shape, dtype=np.uint8)
+
+    start = time.perf_counter()
+    rasterizer.render_camera(camera, trajectory, images)
+    latency = (time.perf_counter() - start) / frames
+
+    return {'resolution': resolution,
+            'markers': markers,
+            'latency': latency}
+
+if __name__ == '__main__':
+    print('[BENCHMARK] Marker rasterization latency per frame')
+
+    for markers in (1, 4, 16):
+        result = benchmark_rasterizer(markers=markers)
+
+        print(f'\t{result["resolution"][0]}x{result["resolution"][1]} - {result["markers"]:>2} markers: '
+              f'{result["latency"] * 1e3:.3f} ms ({1 / result["latency"]:.0f} frames/s)')
@@ -0,0 +1,47 @@
+# Importing modules...
+import time
+import numpy as np
+
+from modules.integration.reprocessing import *
+from modules.integration.synthetic.simulation import AnalyticSimulation
+from modules.vision.synchronizer import Synchronizer
+from modules.benchmark.capture import ring_cameras, marker_trajectory
+
+def benchmark_reprocessing(n_cameras=4,
+                           n_markers=3,
+                           rate=100, # Messages per second of each client
+                           duration=60, # Capture time in seconds
+                           workers=None,
+                           chunk_size=2048,
+                           seed=0):
+
+    cameras = ring_cameras(n_cameras)
+    trajectory = marker_trajectory(n_markers, int(duration * rate), rate, seed)
+    PTS = np.arange(trajectory.shape[0]) / rate
+
+    message_logs = AnalyticSimulation(cameras, seed=seed).simulate_messages(trajectory, PTS, framed=True)
+    synchronizer = Synchronizer(n_markers, 3, 0.05, duration)
+
+    start = time.perf_counter()
+    serial = [reprocess_serial(camera, synchronizer, messages) for camera, messages in zip(cameras, message_logs)]
+    serial_latency = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = Reprocessor(workers, chunk_size).reprocess(cameras, synchronizer, message_logs)
+    parallel_latency = time.perf_counter() - start
+
+    identical = all(np.array_equal(a.sync_blobs, b.sync_blobs) for a, b in zip(serial, parallel))
+
+    return {'messages': sum(len(messages) for messages in message_logs),
+            'serial': serial_latency,
+            'parallel': parallel_latency,
+            'identical': identical}
+
+if __name__ == '__main__':
+    print('[BENCHMARK] Offline reprocessing of a recorded capture')
+
+    for duration in (10, 60):
+        result = benchmark_reprocessing(duration=duration)
+
+        print(f'\t{duration} s capture, {result["messages"]} messages - serial: {result["serial"]:.2f} s, '
+              f'parallel: {result["parallel"]:.2f} s ({result["serial"] / result["parallel"]:.1f}x), identical: {result["identical"]}')
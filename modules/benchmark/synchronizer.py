@@ -0,0 +1,48 @@
+# Importing modules...
+import time
+import numpy as np
+
+from modules.vision.synchronizer import *
+
+def benchmark_synchronizer(n_blobs=3,
+                           window=3, # Interpolation window
+                           rate=100, # Messages per second
+                           duration=10, # Capture time in seconds
+                           step=0.01, # Synchronized PTS step in seconds
+                           seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    # Jittered PTS and blobs moving along smooth trajectories, apart enough to keep their order
+    n_messages = int(duration * rate)
+    PTS = (np.arange(n_messages) + rng.uniform(-0.2, 0.2, n_messages)) / rate
+    phases = rng.uniform(0, 2 * np.pi, (n_blobs, 2))
+    blobs = 100 * np.sin(PTS[:, None, None] + phases) + 300 * np.arange(n_blobs)[:, None] + rng.normal(0, 0.1, (n_messages, n_blobs, 2))
+
+    results = {}
+
+    for interpolation in interpolation_methods:
+        synchronizer = Synchronizer(n_blobs, window, step, duration, interpolation=interpolation)
+        latencies = []
+
+        for message_PTS, message_blobs in zip(PTS, blobs):
+            start = time.perf_counter()
+            synchronizer.add_data(message_blobs, message_PTS)
+            latencies.append(time.perf_counter() - start)
+
+        results[interpolation] = {'p50': float(np.median(latencies[window:])), 'sync_blobs': synchronizer.sync_blobs}
+
+    reference = results['scipy']['sync_blobs']
+
+    return {interpolation: {'p50': result['p50'], 'max_error': float(np.nanmax(np.abs(result['sync_blobs'] - reference)))}
+            for interpolation, result in results.items()}
+
+if __name__ == '__main__':
+    print('[BENCHMARK] Synchronizer add_data latency per interpolation method (p50 in us, error against scipy in px)')
+
+    for n_blobs, window in ((1, 3), (3, 3), (10, 3), (3, 5), (10, 5)):
+        results = benchmark_synchronizer(n_blobs, window)
+
+        print(f'\t{n_blobs:>2} blobs, window {window} - ' +
+              ', '.join(f'{interpolation} {result["p50"] * 1e6:8.1f} us ({result["max_error"]:.1e} px)' for interpolation, result in results.items()) +
+              f', speedup {results["scipy"]["p50"] / results["closed_form"]["p50"]:.1f}x')
@@ -0,0 +1,64 @@
+# Importing modules...
+import time
+import numpy as np
+
+from modules.vision.camera import *
+
+def time_call(function, argument, repetitions):
+    start = time.perf_counter()
+
+    for _ in range(repetitions):
+        function(argument)
+
+    return (time.perf_counter() - start) / repetitions
+
+def benchmark_undistortion(camera, 
+                           batch_sizes=(1, 4, 16, 100, 1000, 100000), # Points undistorted per call
+                           total_points=200000, # Points undistorted per measurement, split in calls of each batch size
+                           seed=0):
+    
+    # Build the lookup table if the camera does not have one yet
+    if camera.undistortion_lut is None:
+        camera.enable_undistortion_lut()
+
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for batch_size in batch_sizes:
+        # Random blob centroids inside the image
+        distorted_points = rng.random((batch_size, 2)) * (np.array(camera.resolution) - 1)
+
+        repetitions = max(10, total_points // batch_size)
+
+        # Time per call of each method
+        solver_time = time_call(camera.solve_undistortion, distorted_points, repetitions)
+        lut_time = time_call(camera.undistort_points, distorted_points, repetitions)
+
+        # Interpolation error against the iterative solver in pixels
+        error = np.linalg.norm(camera.undistort_points(distorted_points) - camera.solve_undistortion(distorted_points), axis=1)
+
+        results.append({'batch_size': batch_size,
+                         'solver_time': solver_time,
+                         'lut_time': lut_time,
+                         'speedup': solver_time / lut_time,
+                         'max_error': float(np.nanmax(error))})
+
+    return results
+
+if __name__ == '__main__':
+    camera = Camera(resolution=(1080, 1080), 
+                    intrinsic_matrix=build_intrinsic_matrix(fov_degrees=60, resolution=(1080, 1080)),
+                    distortion_model='fisheye', 
+                    distortion_coefficients=np.array([0.395, 0.633, -2.417, 2.110]),
+                    undistortion_lut=True)
+    
+    lut = camera.undistortion_lut
+
+    print(f'[BENCHMARK] Undistortion LUT: {lut.step} px step, {lut.max_error:.4f} px sampled maximum error (tolerance {lut.tolerance} px), {lut.failed_points} points the solver failed on')
+
+    for result in benchmark_undistortion(camera):
+        print(f'\t{result["batch_size"]:>6} points - '
+              f'solver {result["solver_time"] * 1e6:10.2f} us, '
+              f'LUT {result["lut_time"] * 1e6:10.2f} us, '
+              f'speedup {result["speedup"]:5.2f}x, '
+              f'error {result["max_error"]:.4f} px')
@@ -0,0 +1,61 @@
+# Importing modules...
+import os
+import pickle
+import numpy as np
+
+# Calibration file format
+calibration_version = 1
+calibration_file = 'calibration.npz'
+
+def save_cameras(path, camera_models):
+    parameters = [camera.get_parameters() for camera in camera_models]
+
+    # Only model parameters are stored, derived data (distortion maps, projection matrices...) is rebuilt on load
+    arrays = {'version': np.array(calibration_version),
+              'n_cameras': np.array(len(parameters)),
+              'resolution': np.array([p['resolution'] for p in parameters], dtype=np.int64).reshape(-1, 2),
+              'intrinsic_matrix': np.array([p['intrinsic_matrix'] for p in parameters]).reshape(-1, 3, 3),
+              'extrinsic_matrix': np.array([p['extrinsic_matrix'] for p in parameters]).reshape(-1, 4, 4),
+              'distortion_model': np.array([p['distortion_model'] or '' for p in parameters], dtype=np.str_), # Empty for no distortion
+              'snr_dB': np.array([p['snr_dB'] for p in parameters], dtype=np.float64)}
+
+    # Coefficient count depends on the distortion model
+    for C, p in enumerate(parameters):
+        arrays[f'distortion_coefficients_{C}'] = p['distortion_coefficients']
+
+    with open(path, 'wb') as file:
+        np.savez(file, **arrays)
+
+def load_cameras(path, camera_type):
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data['version'])
+
+        if version > calibration_version:
+            raise ValueError(f'Calibration version {version} is newer than the supported version {calibration_version}')
+
+        camera_models = []
+        for C in range(int(data['n_cameras'])):
+            parameters = {'resolution': tuple(int(pixels) for pixels in data['resolution'][C]),
+                          'intrinsic_matrix': data['intrinsic_matrix'][C],
+                          'extrinsic_matrix': data['extrinsic_matrix'][C],
+                          'distortion_model': str(data['distortion_model'][C]) or None,
+                          'distortion_coefficients': data[f'distortion_coefficients_{C}'],
+                          'snr_dB': float(data['snr_dB'][C])}
+
+            camera_models.append(camera_type.from_parameters(parameters))
+
+    return camera_models
+
+def load_legacy_cameras(directory):
+    # Calibrations saved as one pickled camera model per file, named by camera index
+    camera_models = []
+    for C in range(len(os.listdir(directory))):
+        # Load the object from the file (Unpickling)
+        try:
+            with open(os.path.join(directory, f'{C}.pkl'), 'rb') as file:
+                camera_models.append(pickle.load(file))
+        
+        except:
+            continue
+
+    return camera_models
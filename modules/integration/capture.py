@@ -0,0 +1,471 @@
+# Importing modules...
+import asyncio
+import collections
+import socket
+import os
+import numpy as np
+
+from modules.integration.ingest import DatagramIngest
+from modules.integration.protocol import decode_header
+from modules.vision.sync_hub import SyncHub
+
+# Queue policies when a stage falls behind
+drop_policies = ('drop_oldest', # Discard the oldest queued item, keeping the freshest data (real-time captures)
+                 'drop_newest', # Discard the incoming item
+                 'block')       # Wait for room, pausing the socket reading so the backlog stays in the kernel buffer
+
+def put(queue, item, policy, statistics, stage):
+    # Non-blocking insertion following the drop policy, returns False if the item could not be queued
+    try:
+        queue.put_nowait(item)
+
+        return True
+
+    except asyncio.QueueFull:
+        if policy == 'drop_newest':
+            statistics[f'{stage}_dropped'] += 1
+
+            return False
+
+        if policy == 'drop_oldest':
+            queue.get_nowait()
+            queue.put_nowait(item)
+            statistics[f'{stage}_dropped'] += 1
+
+            return True
+
+        return False # Blocking policy, caller must wait
+
+def triangulate_available(multiple_view, sync_blobs, available):
+    # Last available client is the reference, paired with the others until a reliable triangulation
+    reference = available[-1]
+
+    for auxiliary in available[:-1]:
+        blobs_pair = [sync_blobs[reference], sync_blobs[auxiliary]]
+
+        triangulated_markers = multiple_view.triangulate_by_pair((reference, auxiliary), blobs_pair)
+
+        # Triangulation is reliable
+        if not np.isnan(triangulated_markers).any():
+            return triangulated_markers
+
+    return None # No pair was able to triangulate
+
+class CaptureProtocol(asyncio.DatagramProtocol):
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def connection_made(self, transport):
+        self.pipeline.transport = transport
+
+    def datagram_received(self, data, address):
+        self.pipeline.ingest(data, address)
+
+    def error_received(self, exception):
+        self.pipeline.statistics['socket_errors'] += 1 # E.g. connection reset by an unreachable client
+
+# Non-blocking capture: receiving, per-client preprocessing and multiple view reconstruction run as separate stages
+class CapturePipeline:
+    def __init__(self,
+                 server, # Server with registered clients and their synchronizers set by a capture request
+                 timeout=5, # Seconds without messages before the capture is closed
+                 ingest_size=4096, # Bounded queue sizes of each stage
+                 client_size=256,
+                 reconstruction_size=64,
+                 policy='drop_oldest', # Drop policy of every queue (see drop_policies)
+                 step_delay=2, # Triangulation steps allowed to delay before skipping to the latest message
+                 on_triangulation=None, # Callback receiving (T, triangulated_markers) as soon as they are available
+                 ring_capacity=None, # Messages kept per client when ingesting into preallocated rings (see DatagramIngest)
+                 recorder=None, # CaptureRecorder of every received datagram, before any stage drops it
+                 deadline=None # Seconds a synchronized PTS waits for missing clients, reconstructing frames as they complete (see SyncHub)
+                 ):
+
+        if policy not in drop_policies:
+            raise ValueError(f'Unknown drop policy {policy}, expected one of {drop_policies}')
+
+        self.server = server
+        self.timeout = timeout
+        self.policy = policy
+        self.step_delay = step_delay
+        self.on_triangulation = on_triangulation
+        self.ring_capacity = ring_capacity
+        self.recorder = recorder
+        self.deadline = deadline
+
+        # Queue sizes
+        self.ingest_size = ingest_size
+        self.client_size = client_size
+        self.reconstruction_size = reconstruction_size
+
+        # Capture specifications from the clients' synchronizers
+        synchronizer = self.server.clients[0].synchronizer
+        self.blob_count = synchronizer.blob_count
+        self.step = synchronizer.step
+        self.max_T = synchronizer.sync_PTS.size - 1
+
+        # Triangulated markers per synchronized PTS, NaN if not triangulated
+        self.triangulated_markers = np.full((synchronizer.sync_PTS.size, 3, self.blob_count), np.nan)
+
+        self.statistics = {'received': 0, 'unknown_address': 0, 'decode_failed': 0, 'accepted': 0, 'refused': 0, 'triangulated': 0, 'socket_errors': 0,
+                           'ingest_dropped': 0, 'client_dropped': 0, 'reconstruction_dropped': 0, 'paused': 0,
+                           'ring_overwritten': 0, 'lost': 0, 'duplicated': 0, 'reordered': 0}
+
+        self.transport = None
+
+    def ingest(self, data, address):
+        # Called for every datagram, must never block the event loop
+        self.statistics['received'] += 1
+
+        if self.recorder is not None:
+            header = decode_header(data)
+            ID = self.server.client_addresses.get(address) if header is None else header[2]
+
+            self.recorder.record(data, ID)
+
+        if not put(self.ingest_queue, (data, address), self.policy, self.statistics, 'ingest'):
+            if self.policy == 'block':
+                # Datagrams that arrive before the reading pauses are kept aside and queued first when it resumes
+                self.overflow.append((data, address))
+                self.pause_reading()
+
+    def pause_reading(self):
+        if not self.paused:
+            self.transport.pause_reading()
+            self.paused = True
+            self.statistics['paused'] += 1
+
+    def resume_reading(self):
+        while self.overflow and not self.ingest_queue.full():
+            self.ingest_queue.put_nowait(self.overflow.popleft())
+
+        if self.paused and not self.overflow:
+            self.transport.resume_reading()
+            self.paused = False
+
+    async def put(self, queue, item, stage):
+        # Queue insertion that waits for room with the blocking policy
+        if not put(queue, item, self.policy, self.statistics, stage) and self.policy == 'block':
+            await queue.put(item)
+
+    async def dispatch(self):
+        # Route datagrams to the queue of their client, until the timeout
+        while True:
+            try:
+                data, address = await asyncio.wait_for(self.ingest_queue.get(), self.timeout)
+
+            except asyncio.TimeoutError:
+                break
+
+            if self.paused:
+                self.resume_reading()
+
+            if data is None: # Shutdown request
+                break
+
+            ID, duplicate = self.server.identify(data, address) # Client Identifier
+
+            if ID is None:
+                self.statistics['unknown_address'] += 1
+                continue
+
+            if duplicate:
+                continue
+
+            await self.put(self.client_queues[ID], data, 'client')
+
+        # Close the per-client stages
+        for queue in self.client_queues:
+            await queue.put(None)
+
+    def preprocess_message(self, client, data):
+        # Decode, undistort and synchronize a message, off the event loop
+        # - Returns the PTS (None if undecodable), whether the blob count is valid and whether the synchronizer accepted it
+        blob_centroids, PTS = self.server.decode_message(data, self.blob_count)
+
+        if PTS is None or blob_centroids is None:
+            return PTS, False, False
+
+        undistorted_blobs = client.camera.undistort_points(blob_centroids)
+
+        return PTS, True, client.synchronizer.add_data(undistorted_blobs, PTS)
+
+    async def preprocess(self, ID):
+        # Decode, undistort and synchronize the messages of a client, one at a time in the executor so the socket keeps being read
+        loop = asyncio.get_running_loop()
+        client = self.server.clients[ID]
+
+        while (data := await self.client_queues[ID].get()) is not None:
+            PTS, valid_blobs, valid_data = await loop.run_in_executor(None, self.preprocess_message, client, data)
+
+            if PTS is None:
+                self.statistics['decode_failed'] += 1
+                continue
+
+            client.message_log.append(data)
+
+            self.statistics['accepted' if valid_data else 'refused'] += 1
+
+            if self.hub is not None:
+                self.hub.update(ID)
+                continue
+
+            await self.put(self.reconstruction_queue, (PTS, valid_blobs), 'reconstruction')
+
+    def drain_rings(self):
+        # Socket reader callback: read every waiting datagram into the client rings and wake their stages
+        if not self.ingest_rings.drain():
+            return
+
+        self.last_arrival = asyncio.get_running_loop().time()
+
+        for ring, event in zip(self.ingest_rings.rings, self.ring_events):
+            if len(ring):
+                event.set()
+
+    def synchronize_ring(self, ID, PTS, blob_centroids, valid):
+        # Undistort and synchronize the valid messages decoded from a ring slice, off the event loop
+        # - Returns whether the synchronizer accepted each message
+        client = self.server.clients[ID]
+        accepted = np.zeros(PTS.size, dtype=bool)
+
+        if not valid.any():
+            return accepted
+
+        # Undistort the blobs of all messages at once
+        undistorted_blobs = client.camera.undistort_points(blob_centroids.reshape(-1, 2)).reshape(-1, self.blob_count, 2)
+
+        for index, blobs in zip(np.nonzero(valid)[0], undistorted_blobs):
+            accepted[index] = client.synchronizer.add_data(blobs, PTS[index])
+
+        return accepted
+
+    async def preprocess_ring(self, ID):
+        # Decode, undistort and synchronize the unread messages of a client, a whole ring slice at a time
+        loop = asyncio.get_running_loop()
+        ring, event = self.ingest_rings.rings[ID], self.ring_events[ID]
+
+        while True:
+            await event.wait()
+            event.clear()
+
+            if not len(ring):
+                if self.closing:
+                    break
+
+                continue
+
+            # Messages are copied out of the ring on the event loop, where the socket reader writes to it
+            PTS, blob_centroids, valid = ring.decode(ring.consume(), self.blob_count)
+            accepted = await loop.run_in_executor(None, self.synchronize_ring, ID, PTS, blob_centroids, valid)
+
+            decoded = ~np.isnan(PTS)
+            self.statistics['decode_failed'] += int(np.count_nonzero(~decoded))
+            self.statistics['accepted'] += int(np.count_nonzero(accepted))
+            self.statistics['refused'] += int(np.count_nonzero(decoded & ~accepted))
+
+            if self.hub is not None:
+                self.hub.update(ID)
+                continue
+
+            for message_PTS, valid_blobs in zip(PTS[decoded], valid[decoded]):
+                await self.put(self.reconstruction_queue, (message_PTS, valid_blobs), 'reconstruction')
+
+    async def watch(self):
+        # Wait until no datagram arrives for the timeout, or a stop request
+        loop = asyncio.get_running_loop()
+        self.last_arrival = loop.time()
+
+        while (remaining := self.last_arrival + self.timeout - loop.time()) > 0:
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), remaining)
+                break
+
+            except asyncio.TimeoutError:
+                continue
+
+    async def reconstruct(self):
+        loop = asyncio.get_running_loop()
+
+        # Same triangulation index logic as the capture loop of the virtual arena
+        T = 0 # Triangulation index
+        T_ = 0 # Ideal triangulation index
+
+        while (item := await self.reconstruction_queue.get()) is not None:
+            PTS, valid_blobs = item
+
+            # Update ideal triangulation index
+            T_idx = int(np.rint(PTS / self.step)) # Triangulation index of the message
+            T_ = T_ if T_idx < T_ else self.max_T if T_idx > self.max_T else T_idx
+
+            # Check for delay
+            if T_ - T > self.step_delay:
+                T = T_ # If delay is exceeded, update triangulation index to last message
+
+            if not valid_blobs:
+                continue
+
+            # Snapshot of the synchronized blobs, so triangulation runs off the event loop while clients keep updating
+            sync_blobs = [client.synchronizer.sync_blobs[T].copy() for client in self.server.clients]
+            available = [ID for ID, blobs in enumerate(sync_blobs) if np.any(blobs >= 0)] # Non-interpolated blobs are negative!
+
+            # If no pair is available to triangulate
+            if len(available) < 2:
+                continue
+
+            triangulated_markers = await loop.run_in_executor(None, self.triangulate, sync_blobs, available)
+
+            if triangulated_markers is not None:
+                self.count_triangulation(T)
+                self.triangulated_markers[T] = triangulated_markers
+
+                if self.on_triangulation is not None:
+                    self.on_triangulation(T, triangulated_markers)
+
+            # Wait for every client to triangulate
+            elif len(available) < len(self.server.clients):
+                continue
+
+            # Update to next triangulation index
+            T = self.max_T if T + 1 > self.max_T else T + 1 # Clip to valid indexes
+
+    async def reconstruct_frames(self):
+        loop = asyncio.get_running_loop()
+
+        # Frames released by the hub, in order, once complete or past their deadline
+        async for T, sync_blobs in self.hub:
+            # Skip to the latest complete frames if the delay is exceeded
+            if self.hub.completed - 1 - T > self.step_delay:
+                continue
+
+            triangulated_markers = await loop.run_in_executor(None, self.triangulate, sync_blobs, sorted(sync_blobs))
+
+            if triangulated_markers is not None:
+                self.count_triangulation(T)
+                self.triangulated_markers[T] = triangulated_markers
+
+                if self.on_triangulation is not None:
+                    self.on_triangulation(T, triangulated_markers)
+
+    def count_triangulation(self, T):
+        # Synchronized PTS triangulated, a PTS triangulated again with more clients counts once
+        if np.isnan(self.triangulated_markers[T]).all():
+            self.statistics['triangulated'] += 1
+
+    async def close_reconstruction(self):
+        # Ends the reconstruction stage once the client stages are drained
+        if self.hub is not None:
+            self.hub.close()
+
+        else:
+            await self.reconstruction_queue.put(None)
+
+    def triangulate(self, sync_blobs, available):
+        return triangulate_available(self.server.multiple_view, sync_blobs, available)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        # Stage queues
+        self.ingest_queue = asyncio.Queue(self.ingest_size)
+        self.client_queues = [asyncio.Queue(self.client_size) for _ in self.server.clients]
+        self.reconstruction_queue = asyncio.Queue(self.reconstruction_size)
+
+        self.overflow = collections.deque()
+        self.paused = False
+        self.closing = False
+        self.stop_event = asyncio.Event()
+
+        # Frames are released by the hub instead of following the messages
+        self.hub = SyncHub([client.synchronizer for client in self.server.clients], self.deadline) if self.deadline is not None else None
+
+        timeout = self.server.udp_socket.gettimeout()
+        self.sequence_statistics = self.server.sequences.statistics # Sequence counters are kept by the server across captures
+
+        if self.ring_capacity:
+            return await self.run_rings(timeout)
+
+        # The endpoint uses a duplicate of the server socket, so closing it leaves the server socket open
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, fileno=os.dup(self.server.udp_socket.fileno()))
+
+        await loop.create_datagram_endpoint(lambda: CaptureProtocol(self), sock=udp_socket)
+
+        try:
+            preprocessing = [asyncio.create_task(self.preprocess(ID)) for ID in range(len(self.server.clients))]
+            reconstruction = asyncio.create_task(self.reconstruct() if self.hub is None else self.reconstruct_frames())
+
+            await self.dispatch()
+
+            # Drain the remaining data through the stages
+            await asyncio.gather(*preprocessing)
+            await self.close_reconstruction()
+            await reconstruction
+
+        finally:
+            self.transport.close()
+            self.server.udp_socket.settimeout(timeout) # Restore the blocking mode shared with the duplicate
+
+        self.update_sequence_statistics()
+
+        return self.triangulated_markers
+
+    async def run_rings(self, timeout):
+        loop = asyncio.get_running_loop()
+
+        # Datagrams are read straight into preallocated rings, the unread messages of a client are processed together
+        # - Rings overwrite their oldest unread messages when full, whatever the drop policy
+        self.ingest_rings = DatagramIngest(self.server, self.ring_capacity, recorder=self.recorder,
+                                           message_logs=[client.message_log for client in self.server.clients])
+        self.ring_events = [asyncio.Event() for _ in self.server.clients]
+
+        self.server.udp_socket.setblocking(False)
+        loop.add_reader(self.server.udp_socket.fileno(), self.drain_rings)
+
+        try:
+            preprocessing = [asyncio.create_task(self.preprocess_ring(ID)) for ID in range(len(self.server.clients))]
+            reconstruction = asyncio.create_task(self.reconstruct() if self.hub is None else self.reconstruct_frames())
+
+            await self.watch()
+
+            # Drain the remaining data through the stages
+            loop.remove_reader(self.server.udp_socket.fileno())
+            self.closing = True
+
+            for event in self.ring_events:
+                event.set()
+
+            await asyncio.gather(*preprocessing)
+            await self.close_reconstruction()
+            await reconstruction
+
+        finally:
+            loop.remove_reader(self.server.udp_socket.fileno())
+            self.server.udp_socket.settimeout(timeout)
+
+        self.statistics['received'] = self.ingest_rings.statistics['received']
+        self.statistics['unknown_address'] = self.ingest_rings.statistics['unknown_address']
+        self.statistics['decode_failed'] += self.ingest_rings.statistics['invalid_size']
+        self.statistics['ring_overwritten'] = sum(ring.overwritten for ring in self.ingest_rings.rings)
+
+        self.update_sequence_statistics()
+
+        return self.triangulated_markers
+
+    def update_sequence_statistics(self):
+        # Lost, duplicated and reordered framed messages during this capture
+        sequence_statistics = self.server.sequences.statistics
+
+        for key in ('lost', 'duplicated', 'reordered'):
+            self.statistics[key] = sequence_statistics[key] - self.sequence_statistics[key]
+
+    def stop(self):
+        # Close the capture without waiting for the timeout
+        self.stop_event.set()
+
+        if self.ring_capacity:
+            return
+
+        # The oldest datagram gives room to the request if needed
+        if self.ingest_queue.full():
+            self.ingest_queue.get_nowait()
+
+        self.ingest_queue.put_nowait((None, None))
@@ -17,7 +17,15 @@ class CoppeliaSim_Camera(Camera):
                  distortion_coefficients=np.zeros(4),
  
                  # Image Noise Model
-                 snr_dB=np.inf # No noise
+                 snr_dB=np.inf, # No noise
+                 noise_seed=None, # Seed of the camera's noise stream, for reproducible simulations
+                 noise_bank=0, # Standard normal fields pre-generated for the noise, 0 to draw new samples every frame
+
+                 # Image Remapping
+                 fixed_point_maps=True, # Remap with compact fixed-point maps instead of float maps
+
+                 # Point Undistortion
+                 undistortion_lut=False # Undistort points with a precomputed lookup table instead of the iterative solver
                  ):
         
         # CoppeliaSim's handle
@@ -44,8 +52,33 @@ class CoppeliaSim_Camera(Camera):
                         distortion_coefficients=distortion_coefficients, 
         
                         # Image Noise Model
-                        snr_dB=snr_dB)
+                        snr_dB=snr_dB,
+                        noise_seed=noise_seed,
+                        noise_bank=noise_bank,
+                        
+                        # Image Remapping
+                        fixed_point_maps=fixed_point_maps,
+                        
+                        # Point Undistortion
+                        undistortion_lut=undistortion_lut)
         
+    @classmethod
+    def from_parameters(cls, parameters):
+        camera = cls(resolution=parameters['resolution'],
+                     fov_degrees=extract_fov(parameters['intrinsic_matrix'], parameters['resolution']),
+                     pose=np.linalg.inv(parameters['extrinsic_matrix']),
+                     distortion_model=parameters['distortion_model'],
+                     distortion_coefficients=parameters['distortion_coefficients'],
+                     snr_dB=parameters['snr_dB'])
+        
+        # Keep the exact calibrated matrices instead of the ones rebuilt from the FOV and pose
+        camera.update_extrinsic(parameters['extrinsic_matrix'])
+
+        if not np.allclose(camera.intrinsic_matrix, parameters['intrinsic_matrix']):
+            camera.update_intrinsic(parameters['intrinsic_matrix'])
+
+        return camera
+
     def get_image(self, api_method):
         # If any Vision Sensor handle is associated with camera, return black image
         if self.vision_sensor_handle is None:
@@ -57,18 +90,22 @@ class CoppeliaSim_Camera(Camera):
         # Convert buffer into single channel image
         image_unflipped = np.frombuffer(buffer, dtype=np.uint8).reshape(self.image_shape)
 
+        return self.model_image(image_unflipped)
+
+    def model_image(self, image_unflipped, image_buffer=None, distorted_buffer=None, noisy_buffer=None):
         # In CoppeliaSim images are left to right (x-axis), and bottom to top (y-axis)
         # This is consistent with the axes of vision sensors, pointing Z outwards, Y up
-        image_noiseless = cv2.flip(image_unflipped, 0)
+        # - The flipped, distorted and noisy images are written to image_buffer, distorted_buffer and noisy_buffer if given, new images otherwise
+        image_noiseless = cv2.flip(image_unflipped, 0, dst=image_buffer)
 
         # Use cv2.remap with the custom remapped coordinates
         if self.distortion_model is not None:
-            image_distorted = self.distort_image(image_noiseless)
+            image_distorted = self.distort_image(image_noiseless, out=distorted_buffer)
             
         else:
             image_distorted = image_noiseless # No distortion is applied
         
         # Add noise based on the desired SNR for the image
-        modeled_image = self.noise_image(image_distorted)
+        modeled_image = self.noise_image(image_distorted, out=noisy_buffer)
 
         return modeled_image
\ No newline at end of file
@@ -0,0 +1,88 @@
+# Importing modules...
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+from modules.vision.blob_detection import *
+
+# Concurrent image modeling and blob detection for a set of CoppeliaSim cameras
+class CoppeliaSim_Pipeline:
+    def __init__(self,
+                 cameras=[], # CoppeliaSim_Camera objects, one pipeline stage per camera
+                 workers=None, # Thread pool size, defaults to one thread per camera
+                 area=False, # Return blob sizes
+                 backend='simple', # Blob detection backend (see detect_blobs)
+                 tracking=False # Use a BlobTracker per camera instead of a full image scan each step
+                 ):
+
+        self.cameras = list(cameras)
+        self.area = area
+        self.backend = backend
+
+        # OpenCV and most of NumPy release the GIL, so cameras are processed in parallel by threads
+        self.executor = ThreadPoolExecutor(max_workers=workers or max(len(self.cameras), 1))
+
+        # Per-camera preallocated flipped, distorted and noisy images
+        self.image_buffers = [np.empty(camera.image_shape, dtype=np.uint8) for camera in self.cameras]
+        self.distorted_buffers = [np.empty(camera.image_shape, dtype=np.uint8) for camera in self.cameras]
+        self.noisy_buffers = [np.empty(camera.image_shape, dtype=np.uint8) for camera in self.cameras]
+
+        # Per-camera detectors, cv2.SimpleBlobDetector keeps internal state while detecting
+        self.detectors = [cv2.SimpleBlobDetector_create(params) for _ in self.cameras]
+        self.trackers = [BlobTracker() for _ in self.cameras] if tracking else None
+
+        # Last modeled image of each camera, overwritten by the next step
+        self.images = [None] * len(self.cameras)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def process_camera(self, index, image_unflipped):
+        camera = self.cameras[index]
+
+        # Flip, distort and add noise
+        image = camera.model_image(image_unflipped, self.image_buffers[index], self.distorted_buffers[index], self.noisy_buffers[index])
+        self.images[index] = image
+
+        # Detect blobs
+        if self.trackers is not None:
+            return self.trackers[index].detect(image, area=self.area)
+
+        return detect_blobs(image,
+                            area=self.area,
+                            detector=self.detectors[index],
+                            backend=self.backend)
+
+    def get_buffers(self, api_method):
+        # Vision sensor images are fetched serially, the remote API client is not thread safe
+        images_unflipped = []
+
+        for camera in self.cameras:
+            # Cameras without Vision Sensor see a black image
+            if camera.vision_sensor_handle is None:
+                images_unflipped.append(np.zeros(camera.image_shape, dtype=np.uint8))
+                continue
+
+            # Get grayscale image buffer
+            buffer, _ = api_method(camera.vision_sensor_handle, 1) # Set second argument to 1 for grayscale, 0 for RGB
+
+            images_unflipped.append(np.frombuffer(buffer, dtype=np.uint8).reshape(camera.image_shape))
+
+        return images_unflipped
+
+    def process(self, images_unflipped):
+        # Run every camera concurrently, the step takes as long as the slowest camera
+        futures = [self.executor.submit(self.process_camera, index, image_unflipped)
+                   for index, image_unflipped in enumerate(images_unflipped)]
+
+        return [future.result() for future in futures]
+
+    def step(self, api_method):
+        # Blobs detected by each camera in the current simulation step
+        return self.process(self.get_buffers(api_method))
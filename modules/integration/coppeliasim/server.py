@@ -1,9 +1,12 @@
 import copy
 
 from modules.integration.server import *
+from modules.integration.coppeliasim.camera import *
 from modules.vision.synchronizer import *
 
 class CoppeliaSim_Server(Server): 
+    camera_type = CoppeliaSim_Camera # Camera model rebuilt when loading calibrations
+
     def __init__(self, 
                  clients = [],
                  server_address = ('127.0.0.1', 8888),
@@ -20,6 +23,7 @@ class CoppeliaSim_Server(Server):
     def register_clients(self):
         # Clearing the previous addresses (client addresses may change from capture to capture)
         self.client_addresses.clear()
+        self.sequences = SequenceTracker(self.n_clients) # Clients restart their sequence numbers
 
         print('[SERVER] Waiting for clients...')
 
@@ -0,0 +1,222 @@
+# Importing modules...
+import select
+import time
+import numpy as np
+
+from modules.integration.protocol import *
+
+# Fixed size history of the messages of a client, stored as float32 rows
+class MessageRing:
+    def __init__(self,
+                 capacity=1024, # Messages kept before the oldest unread ones are overwritten
+                 max_values=192 # Float32 blob values per message slot, [u, v, A] per blob (64 blobs by default)
+                 ):
+
+        self.capacity = capacity
+        self.max_values = max_values
+
+        # Message slots, with the number of float32 blob values, the PTS and the arrival time of each message
+        self.data = np.zeros((capacity, max_values), dtype=np.float32)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+        self.PTS = np.zeros(capacity, dtype=np.float64)
+        self.arrivals = np.zeros(capacity, dtype=np.float64)
+
+        # Message counters, slots are indexed by counter modulo capacity
+        self.written = 0 # Messages written so far
+        self.read = 0 # Messages consumed so far
+        self.overwritten = 0 # Unread messages lost by overwriting
+
+    def __len__(self):
+        # Unread messages
+        return self.written - self.read
+
+    def write(self, values, length, PTS, arrival):
+        # PTS is NaN for undecodable messages
+        # - Returns whether the message was stored, always since the oldest unread one is overwritten
+        slot = self.written % self.capacity
+
+        self.data[slot, :length] = values[:length]
+        self.lengths[slot] = length
+        self.PTS[slot] = PTS
+        self.arrivals[slot] = arrival
+
+        self.written += 1
+
+        # Oldest unread message was overwritten
+        if self.written - self.read > self.capacity:
+            self.read += 1
+            self.overwritten += 1
+
+        return True
+
+    def consume(self, max_messages=None):
+        # Ring slots of the unread messages, in arrival order
+        count = len(self) if max_messages is None else min(len(self), max_messages)
+        slots = np.arange(self.read, self.read + count) % self.capacity
+
+        self.read += count
+
+        return slots
+
+    def decode(self, slots, blob_count):
+        # Whole slice version of Server.decode_message
+        # - Returns the PTS of every message (NaN if undecodable) and the blob centroids of the valid messages with their mask
+        lengths = self.lengths[slots]
+        PTS = self.PTS[slots]
+
+        # Valid message has [u, v, A] per blob
+        valid = (lengths == 3 * blob_count) & ~np.isnan(PTS)
+        blob_centroids = self.data[slots[valid], :3 * blob_count].reshape(-1, blob_count, 3)[:, :, :2]
+
+        return PTS, blob_centroids, valid
+
+# Datagram ingestion straight into preallocated per-client rings
+class DatagramIngest:
+    def __init__(self,
+                 server, # Server with registered clients
+                 capacity=1024, # Messages kept per client
+                 max_values=None, # Float32 values per message slot, defaults to what fits in the server buffer size
+                 rings=None, # Message ring of each client, built from the capacity and slot size by default (e.g. shared memory rings)
+                 recorder=None, # CaptureRecorder of every received datagram
+                 message_logs=None # List of each client the accepted datagrams are appended to (e.g. the clients' message_log)
+                 ):
+
+        self.server = server
+        self.udp_socket = server.udp_socket
+        self.recorder = recorder
+        self.message_logs = message_logs
+
+        if rings is not None:
+            max_values = max(ring.max_values for ring in rings)
+
+        elif max_values is None:
+            max_values = getattr(server, 'buffer_size', 1024) // 4
+
+        self.rings = rings if rings is not None else [MessageRing(capacity, max_values) for _ in server.clients]
+
+        # Staging row each datagram is received into, with room for a header and one extra value to detect oversized datagrams
+        self.header_values = header_size // 4
+        self.staging = np.zeros(self.header_values + max_values + 1, dtype=np.float32)
+        self.staging_bytes = memoryview(self.staging).cast('B')
+
+        self.statistics = {'received': 0, 'unknown_address': 0, 'invalid_size': 0, 'duplicated': 0}
+
+    def drain(self, max_datagrams=None):
+        # Read every datagram waiting in the socket without blocking, returns the number read
+        count = 0
+        timeout = self.udp_socket.gettimeout()
+        self.udp_socket.setblocking(False)
+
+        try:
+            while max_datagrams is None or count < max_datagrams:
+                try:
+                    n_bytes, address = self.udp_socket.recvfrom_into(self.staging_bytes)
+
+                except (BlockingIOError, InterruptedError):
+                    break
+
+                except ConnectionResetError:
+                    continue
+
+                arrival = time.monotonic()
+                count += 1
+
+                ID = self.write(n_bytes, address, arrival)
+
+                if self.recorder is not None:
+                    self.recorder.record(self.staging_bytes[:n_bytes], ID, arrival)
+
+        finally:
+            self.udp_socket.settimeout(timeout)
+
+        self.statistics['received'] += count
+
+        return count
+
+    def write(self, n_bytes, address, arrival):
+        # Write the staged datagram to the ring of its client, returns the client ID (None if unknown)
+        staging_bytes = self.staging_bytes[:n_bytes]
+        header = decode_header(staging_bytes)
+
+        if header is None: # Legacy message, [u, v, A] per blob and the PTS
+            ID = self.server.client_addresses.get(address) # Client Identifier
+
+            if ID is None:
+                self.statistics['unknown_address'] += 1
+                return None
+
+            # Messages are whole float32 values that fit in a slot
+            length = n_bytes // 4 - 1
+
+            if n_bytes % 4 or length > self.rings[ID].max_values:
+                self.statistics['invalid_size'] += 1
+                return ID
+
+            PTS = self.staging[length] if length >= 0 else np.nan
+            stored = self.rings[ID].write(self.staging, max(length, 0), PTS, arrival)
+
+            # Same messages the queue path logs, ring slots do not keep the datagram bytes
+            if stored and self.message_logs is not None and length >= 0:
+                self.message_logs[ID].append(bytes(staging_bytes))
+
+            return ID
+
+        version, _, ID, sequence, blob_count, PTS = header
+
+        if ID >= len(self.rings):
+            self.statistics['unknown_address'] += 1
+            return None
+
+        # Blob records follow the header
+        length = 3 * blob_count
+
+        if version != protocol_version or n_bytes != header_size + 4 * length or length > self.rings[ID].max_values:
+            self.statistics['invalid_size'] += 1
+            return ID
+
+        if self.server.sequences.seen(ID, sequence):
+            self.server.sequences.update(ID, sequence) # Only counts the duplicate
+            self.statistics['duplicated'] += 1
+            return ID
+
+        # Messages dropped by a full ring keep their sequence number unused, as if they were lost
+        if not self.rings[ID].write(self.staging[self.header_values:], length, PTS, arrival):
+            return ID
+
+        self.server.sequences.update(ID, sequence)
+
+        if self.message_logs is not None:
+            self.message_logs[ID].append(bytes(staging_bytes))
+
+        return ID
+
+    def receive(self, timeout=None):
+        # Wait for datagrams and read all of them, returns 0 on timeout
+        readable, _, _ = select.select([self.udp_socket], [], [], timeout)
+
+        if not readable:
+            return 0
+
+        return self.drain()
+
+    def synchronize(self, ID, blob_count):
+        # Decode, undistort and synchronize every unread message of a client
+        # - Returns the PTS of the consumed messages (NaN if empty), whether their blob count is valid and whether the synchronizer accepted them
+        client = self.server.clients[ID]
+        ring = self.rings[ID]
+
+        slots = ring.consume()
+        PTS, blob_centroids, valid = ring.decode(slots, blob_count)
+
+        accepted = np.zeros(slots.size, dtype=bool)
+
+        if not valid.any():
+            return PTS, valid, accepted
+
+        # Undistort the blobs of all messages at once
+        undistorted_blobs = client.camera.undistort_points(blob_centroids.reshape(-1, 2)).reshape(-1, blob_count, 2)
+
+        for index, blobs in zip(np.nonzero(valid)[0], undistorted_blobs):
+            accepted[index] = client.synchronizer.add_data(blobs, PTS[index])
+
+        return PTS, valid, accepted
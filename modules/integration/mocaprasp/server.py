@@ -18,13 +18,21 @@ class MoCapRasp_Server(Server):
         self.buffer_size = 1024 # In bytes
         self.client_ips = {} # FIX THIS !!
 
-    def register_clients(self):
+    def register_clients(self, client_ips=None):
         # Clearing the previous addresses (client addresses may change from capture to capture)
         self.client_addresses.clear()
+        self.sequences = SequenceTracker(self.n_clients) # Clients restart their sequence numbers
         self.client_ips.clear()
 
+        # Known client IPs skip the hostname resolution (e.g. emulated clients)
+        if client_ips is not None:
+            self.client_ips.update(client_ips)
+
         # Check client connection to network
         for ID in range(self.n_clients):
+            if ID in self.client_ips.values():
+                continue
+
             try:
                 IP = socket.gethostbyname(f'pi{ID}.local')
                 self.client_ips[IP] = ID
@@ -0,0 +1,506 @@
+# Importing modules...
+import multiprocessing
+from multiprocessing import shared_memory
+import queue
+import time
+import numpy as np
+
+from modules.integration.ingest import *
+from modules.integration.capture import triangulate_available
+
+# Named arrays laid out in a single shared memory block, attached by name from other processes
+class SharedArrays:
+    def __init__(self,
+                 layout, # Shape and dtype of each array by name, as {name: (shape, dtype)}
+                 name=None # Shared memory block to attach to, a new zeroed block is created by default
+                 ):
+
+        self.layout = {key: (tuple(shape), np.dtype(dtype)) for key, (shape, dtype) in layout.items()}
+        self.owner = name is None
+
+        # Every array starts at a cache line, so counters written by different processes do not share one
+        offsets, size = {}, 0
+
+        for key, (shape, dtype) in self.layout.items():
+            offsets[key] = size
+            size += -(-int(np.prod(shape)) * dtype.itemsize // 64) * 64
+
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=max(size, 64))
+        self.arrays = {key: np.ndarray(shape, dtype, buffer=self.memory.buf, offset=offsets[key])
+                       for key, (shape, dtype) in self.layout.items()}
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def __getstate__(self):
+        # Only the layout and the block name cross process boundaries
+        return {'layout': self.layout, 'name': self.memory.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['layout'], state['name'])
+
+    def close(self):
+        # Array views must be released before the block is unmapped
+        self.arrays = {}
+        self.memory.close()
+
+        if self.owner:
+            self.memory.unlink()
+
+# Message ring in shared memory, written by a single producer process and read by a single consumer process
+# - Lock-free: the producer only moves the written counter, the consumer only moves the read counter
+# - A full ring drops the incoming message, since the unread slots belong to the consumer
+class SharedMessageRing(MessageRing):
+    def __init__(self,
+                 capacity=1024, # Messages kept before incoming ones are dropped
+                 max_values=192, # Float32 blob values per message slot
+                 shared=None # Shared arrays to attach to, allocated by default
+                 ):
+
+        self.capacity = capacity
+        self.max_values = max_values
+
+        self.shared = shared if shared is not None else SharedArrays({'data': ((capacity, max_values), np.float32),
+                                                                      'lengths': ((capacity,), np.int32),
+                                                                      'PTS': ((capacity,), np.float64),
+                                                                      'arrivals': ((capacity,), np.float64),
+                                                                      'counters': ((3,), np.int64)}) # Written, read and dropped messages
+
+        self.data = self.shared['data']
+        self.lengths = self.shared['lengths']
+        self.PTS = self.shared['PTS']
+        self.arrivals = self.shared['arrivals']
+        self.counters = self.shared['counters']
+
+    def __getstate__(self):
+        return {'capacity': self.capacity, 'max_values': self.max_values, 'shared': self.shared}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def written(self):
+        return int(self.counters[0])
+
+    @property
+    def read(self):
+        return int(self.counters[1])
+
+    @property
+    def dropped(self):
+        return int(self.counters[2])
+
+    def write(self, values, length, PTS, arrival):
+        # Returns whether the message was stored, a full ring drops it
+        written = self.written
+
+        if written - self.read >= self.capacity:
+            self.counters[2] += 1
+            return False
+
+        slot = written % self.capacity
+
+        self.data[slot, :length] = values[:length]
+        self.lengths[slot] = length
+        self.PTS[slot] = PTS
+        self.arrivals[slot] = arrival
+
+        # Message is published only after its slot is written
+        self.counters[0] = written + 1
+
+        return True
+
+    def unread(self, max_messages=None):
+        # Ring slots of the unread messages, in arrival order, which stay reserved until released
+        read = self.read
+        count = self.written - read if max_messages is None else min(self.written - read, max_messages)
+
+        return np.arange(read, read + count) % self.capacity
+
+    def release(self, count):
+        # Give the slots of consumed messages back to the producer
+        self.counters[1] += count
+
+    def consume(self, max_messages=None):
+        # Only safe once the slots are copied out, use unread and release otherwise
+        slots = self.unread(max_messages)
+        self.release(slots.size)
+
+        return slots
+
+    def close(self):
+        self.data = self.lengths = self.PTS = self.arrivals = self.counters = None
+        self.shared.close()
+
+# Closing flag values, written by the calling process
+closing = 1 # Drain the rings and finish
+aborting = 2 # Stop right away, a worker died
+
+def preprocess_clients(worker, IDs, rings, cameras, tasks, signals, shared, results):
+    # Worker process: decode, undistort and synchronize the messages of some clients
+    # - The PTS of every decoded message is signaled to the reconstruction worker, once its synchronized blobs are published
+    sync_blobs = shared['sync_blobs']
+    statistics = shared['statistics'] # Decode failed, accepted and refused messages per client
+
+    shared['ready'][worker] = 1
+
+    # Synchronizers arrive when the capture runs, after the capture request set them
+    synchronizers = tasks.get()
+
+    if synchronizers is None: # Closed without capturing
+        return
+
+    # Interpolated blobs are written straight to shared memory
+    for ID, synchronizer in zip(IDs, synchronizers):
+        sync_blobs[ID] = synchronizer.sync_blobs
+        synchronizer.sync_blobs = sync_blobs[ID]
+
+    blob_count = synchronizers[0].blob_count
+    idle = 0
+
+    while True:
+        closing_flag = shared['control'][0] # Read before the rings, so every message written before closing is processed
+
+        if closing_flag == aborting:
+            return
+
+        busy = False
+
+        for ID, ring, camera, synchronizer in zip(IDs, rings, cameras, synchronizers):
+            slots = ring.unread()
+
+            if not slots.size:
+                continue
+
+            busy = True
+
+            PTS, blob_centroids, valid = ring.decode(slots, blob_count) # Copies out of the ring
+            ring.release(slots.size)
+
+            decoded = ~np.isnan(PTS)
+            accepted = np.zeros(slots.size, dtype=bool)
+
+            if valid.any():
+                undistorted_blobs = camera.undistort_points(blob_centroids.reshape(-1, 2)).reshape(-1, blob_count, 2)
+
+                for index, blobs in zip(np.nonzero(valid)[0], undistorted_blobs):
+                    accepted[index] = synchronizer.add_data(blobs, PTS[index])
+
+            statistics[ID] += (np.count_nonzero(~decoded), np.count_nonzero(accepted), np.count_nonzero(decoded & ~accepted))
+
+            # Synchronized PTS completed so far, published after the synchronized blobs
+            if valid.any():
+                shared['progress'][ID] = synchronizer.interpolation_start
+
+            if decoded.any():
+                signals.put((PTS[decoded], valid[decoded]))
+
+        if busy:
+            idle = 0
+            continue
+
+        if closing_flag == closing:
+            break
+
+        # Back off while the clients are silent, up to a millisecond
+        idle = min(idle + 1, 10)
+        time.sleep(idle * 1e-4)
+
+    signals.put(None) # No more messages from these clients
+
+    # Synchronizers go back once, with their raw history, for calibration flows
+    for synchronizer in synchronizers:
+        synchronizer.sync_blobs = synchronizer.sync_blobs.copy()
+
+    results.put((IDs, synchronizers))
+
+def reconstruct(worker, workers, multiple_view, signals, shared, step, step_delay):
+    # Worker process: triangulate the synchronized PTS, message after message as the preprocessing workers signal them
+    sync_blobs = shared['sync_blobs']
+    triangulated_markers = shared['triangulated_markers']
+    n_clients = sync_blobs.shape[0]
+    max_T = sync_blobs.shape[1] - 1
+
+    # Same triangulation index logic as the capture loop of the virtual arena
+    T = 0 # Triangulation index
+    T_ = 0 # Ideal triangulation index
+
+    finished = 0 # Preprocessing workers done
+
+    shared['ready'][worker] = 1
+
+    while finished < workers:
+        # Aborted capture, a preprocessing worker died and will never finish
+        if shared['control'][0] == aborting:
+            break
+
+        try:
+            signal = signals.get(timeout=0.1)
+
+        except queue.Empty:
+            continue
+
+        if signal is None:
+            finished += 1
+            continue
+
+        for PTS, valid_blobs in zip(*signal):
+            # Update ideal triangulation index
+            T_idx = int(np.rint(PTS / step)) # Triangulation index of the message
+            T_ = T_ if T_idx < T_ else max_T if T_idx > max_T else T_idx
+
+            # Check for delay
+            if T_ - T > step_delay:
+                T = T_ # If delay is exceeded, update triangulation index to last message
+
+            if not valid_blobs:
+                continue
+
+            # Only published PTS are read, others may be halfway written
+            published = shared['progress'] > T
+            blobs = sync_blobs[:, T].copy()
+            available = np.nonzero(published & (blobs >= 0).any(axis=(1, 2)))[0].tolist() # Non-interpolated blobs are negative!
+
+            # If no pair is available to triangulate
+            if len(available) < 2:
+                continue
+
+            markers = triangulate_available(multiple_view, blobs, available)
+
+            if markers is not None:
+                # Synchronized PTS triangulated, a PTS triangulated again with more clients counts once
+                if np.isnan(triangulated_markers[T]).all():
+                    shared['control'][1] += 1
+
+                triangulated_markers[T] = markers
+
+            # Wait for every client to triangulate
+            elif len(available) < n_clients:
+                continue
+
+            # Update to next triangulation index
+            T = max_T if T + 1 > max_T else T + 1 # Clip to valid indexes
+
+# Capture with receiving, per-client preprocessing and reconstruction in separate processes, sharing memory
+# - The calling process receives datagrams into shared message rings, one per client
+# - Preprocessing workers own a share of the clients each, reconstruction runs in its own worker
+class ProcessPipeline:
+    def __init__(self,
+                 server, # Server with registered clients and their synchronizers set by a capture request
+                 synchronizer=None, # Synchronizer of the capture request, taken from the clients by default (e.g. when started ahead of the request)
+                 workers=None, # Preprocessing processes, one per client (up to the available cores) by default
+                 timeout=5, # Seconds without messages before the capture is closed
+                 ring_capacity=1024, # Messages kept per client
+                 step_delay=2, # Triangulation steps allowed to delay before skipping to the latest message
+                 context=None, # Multiprocessing start method, the platform default by default
+                 recorder=None, # CaptureRecorder of every received datagram
+                 join_timeout=5 # Seconds to wait for each worker to exit when closing, before terminating it
+                 ):
+
+        self.server = server
+        self.n_clients = len(server.clients)
+        self.workers = min(workers or max((multiprocessing.cpu_count() or 1) - 1, 1), self.n_clients)
+        self.timeout = timeout
+        self.ring_capacity = ring_capacity
+        self.step_delay = step_delay
+        self.context = multiprocessing.get_context(context)
+        self.recorder = recorder
+        self.join_timeout = join_timeout
+
+        # Capture specifications from the clients' synchronizers
+        if synchronizer is None:
+            synchronizer = self.server.clients[0].synchronizer
+
+        self.blob_count = synchronizer.blob_count
+        self.step = synchronizer.step
+        self.n_sync = synchronizer.sync_PTS.size
+
+        self.processes = None
+        self.stopped = False
+        self.statistics = {}
+
+    def stop(self):
+        # Close the capture without waiting for the timeout, e.g. from another thread
+        self.stopped = True
+
+    def start(self):
+        # Start the workers and wait until they are ready
+        # - May be called ahead of the capture request and the client registration, since starting processes is slow with the spawn start method
+        # - Synchronizers are only sent to the workers by run, so the ones set by the capture request are used
+        self.shared = SharedArrays({'sync_blobs': ((self.n_clients, self.n_sync, self.blob_count, 2), np.float64),
+                                    'triangulated_markers': ((self.n_sync, 3, self.blob_count), np.float64),
+                                    'statistics': ((self.n_clients, 3), np.int64),
+                                    'progress': ((self.n_clients,), np.int64),
+                                    'ready': ((self.workers + 1,), np.int8),
+                                    'control': ((2,), np.int64)}) # Closing flag and triangulation count
+
+        self.shared['triangulated_markers'][:] = np.nan
+
+        max_values = getattr(self.server, 'buffer_size', 1024) // 4
+        self.rings = [SharedMessageRing(self.ring_capacity, max_values) for _ in self.server.clients]
+
+        # Clients are dealt to the preprocessing workers in turn
+        self.results = self.context.Queue()
+        self.signals = self.context.Queue() # PTS of the preprocessed messages, for the reconstruction worker
+        self.tasks = [self.context.Queue() for _ in range(self.workers)] # Synchronizers of each preprocessing worker
+        self.running = False
+        self.processes = []
+
+        for worker, tasks in enumerate(self.tasks):
+            IDs = self.worker_IDs(worker)
+
+            self.processes.append(self.context.Process(target=preprocess_clients,
+                                                       args=(worker, IDs, [self.rings[ID] for ID in IDs],
+                                                             [self.server.clients[ID].camera for ID in IDs],
+                                                             tasks, self.signals, self.shared, self.results),
+                                                       daemon=True))
+
+        self.processes.append(self.context.Process(target=reconstruct,
+                                                   args=(self.workers, self.workers, self.server.multiple_view, self.signals, self.shared, self.step, self.step_delay),
+                                                   daemon=True))
+
+        for process in self.processes:
+            process.start()
+
+        while not self.shared['ready'].all():
+            if not all(process.is_alive() for process in self.processes):
+                self.close()
+
+                raise RuntimeError('Capture worker failed to start')
+
+            time.sleep(0.01)
+
+    def run(self):
+        if self.processes is None:
+            self.start()
+
+        # Capture specifications the shared memory was laid out for
+        for client in self.server.clients:
+            synchronizer = client.synchronizer
+
+            if (synchronizer.blob_count, synchronizer.step, synchronizer.sync_PTS.size) != (self.blob_count, self.step, self.n_sync):
+                self.close()
+
+                raise ValueError('Synchronizers of the capture request do not match the ones the pipeline was created with')
+
+        for worker, tasks in enumerate(self.tasks):
+            tasks.put([self.server.clients[ID].synchronizer for ID in self.worker_IDs(worker)])
+
+        self.running = True
+
+        ingest = DatagramIngest(self.server, rings=self.rings, recorder=self.recorder,
+                                message_logs=[client.message_log for client in self.server.clients])
+        sequence_statistics = self.server.sequences.statistics
+
+        try:
+            last_arrival = time.monotonic()
+
+            while not self.stopped and time.monotonic() - last_arrival < self.timeout:
+                if ingest.receive(min(self.timeout, 0.1)):
+                    last_arrival = time.monotonic()
+
+                # A dead worker stops the capture, close reports it
+                if self.failed_workers():
+                    break
+
+        finally:
+            triangulated_markers = self.close()
+
+        per_client = self.statistics.pop('per_client')
+        self.statistics.update({'received': ingest.statistics['received'],
+                                'unknown_address': ingest.statistics['unknown_address'],
+                                'decode_failed': int(per_client[0]) + ingest.statistics['invalid_size'],
+                                'accepted': int(per_client[1]),
+                                'refused': int(per_client[2])})
+
+        sequences = self.server.sequences.statistics
+
+        for key in ('lost', 'duplicated', 'reordered'):
+            self.statistics[key] = sequences[key] - sequence_statistics[key]
+
+        return triangulated_markers
+
+    def failed_workers(self):
+        # Workers that exited with an error (e.g. crashed or killed)
+        return [worker for worker, process in enumerate(self.processes) if process.exitcode not in (None, 0)]
+
+    def worker_IDs(self, worker):
+        # Clients of a preprocessing worker
+        return list(range(worker, self.n_clients, self.workers))
+
+    def worker_name(self, worker):
+        if worker == self.workers:
+            return 'reconstruction worker'
+
+        return f'preprocessing worker {worker} (clients {self.worker_IDs(worker)})'
+
+    def close(self):
+        # Let the workers drain their rings and finish, then release the shared memory
+        # - Returns the triangulated markers of each synchronized PTS
+        # - Raises RuntimeError if a worker died, after terminating the others
+        if not self.running:
+            # Closed without capturing, the workers are waiting for their synchronizers
+            self.shared['control'][0] = aborting
+
+            for tasks in self.tasks:
+                tasks.put(None)
+
+        else:
+            self.shared['control'][0] = closing
+
+        # Results are collected before joining, so the workers can flush their queue
+        collected = 0
+        last_result = time.monotonic()
+
+        while self.running and collected < self.workers and not self.failed_workers():
+            try:
+                IDs, synchronizers = self.results.get(timeout=0.1)
+
+            except queue.Empty:
+                if time.monotonic() - last_result > self.join_timeout: # Stuck worker, terminated below
+                    break
+
+                continue
+
+            last_result = time.monotonic()
+
+            for ID, synchronizer in zip(IDs, synchronizers):
+                self.server.clients[ID].synchronizer = synchronizer
+
+            collected += 1
+
+        if self.running and collected < self.workers:
+            self.shared['control'][0] = aborting
+
+        failed = {worker: self.processes[worker].exitcode for worker in self.failed_workers()}
+
+        for worker, process in enumerate(self.processes):
+            process.join(self.join_timeout)
+
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+                failed.setdefault(worker, 'terminated')
+
+            # Died while the others were joined
+            elif process.exitcode:
+                failed.setdefault(worker, process.exitcode)
+
+        triangulated_markers = self.shared['triangulated_markers'].copy()
+
+        self.statistics = {'per_client': self.shared['statistics'].sum(axis=0),
+                           'triangulated': int(self.shared['control'][1]),
+                           'ring_dropped': sum(ring.dropped for ring in self.rings)}
+
+        for ring in self.rings:
+            ring.close()
+
+        self.shared.close()
+        self.processes = None
+
+        if failed:
+            raise RuntimeError('Capture workers failed: ' + ', '.join(f'{self.worker_name(worker)} ({exit_code if exit_code == "terminated" else f"exit code {exit_code}"})'
+                                                                      for worker, exit_code in sorted(failed.items())))
+
+        return triangulated_markers
@@ -0,0 +1,163 @@
+# Importing modules...
+import struct
+import numpy as np
+
+# Wire protocol of the client messages
+# - Framed message: header followed by one [u, v, A] float32 record per blob, little-endian
+# - Legacy message: [u, v, A] per blob and the PTS of the message, in float32
+protocol_version = 1
+
+# Magic word read as a float32 is a NaN, which no legacy message starts with
+magic = b'VM\xc1\xff'
+
+# Header: magic, version, flags, client ID, sequence number, blob count and PTS
+header_struct = struct.Struct('<4sBBHIId')
+header_dtype = np.dtype([('magic', 'S4'), ('version', 'u1'), ('flags', 'u1'), ('client_ID', '<u2'),
+                         ('sequence', '<u4'), ('blob_count', '<u4'), ('PTS', '<f8')])
+header_size = header_struct.size # 24 bytes, so blob records stay float32 aligned
+
+blob_dtype = np.dtype([('u', '<f4'), ('v', '<f4'), ('A', '<f4')])
+
+# Message flags
+flag_end_of_stream = 1 # Last message of the client capture
+flag_overflow = 2 # Client detected more blobs than it sent
+
+def is_framed(message_bytes):
+    return len(message_bytes) >= header_size and message_bytes[:4] == magic
+
+def encode_message(client_ID, sequence, PTS, blobs=(), flags=0):
+    # Blobs shaped (blob_count, 3) as [u, v, A]
+    blobs = np.asarray(blobs, dtype='<f4').reshape(-1, 3)
+
+    header = header_struct.pack(magic, protocol_version, flags, client_ID, sequence & 0xFFFFFFFF, blobs.shape[0], PTS)
+
+    return header + blobs.tobytes()
+
+def encode_messages(client_ID, sequences, PTS, blobs, blob_counts, flags=0):
+    # Messages of a client for many PTS at once, blobs shaped (messages, max blob count, 3) and cut to their blob counts
+    n_messages, max_blobs, _ = blobs.shape
+
+    # Every message is laid out in a row with room for all blobs
+    message_array = np.zeros(n_messages, dtype=[('header', header_dtype), ('blobs', blob_dtype, (max_blobs,))])
+
+    header = message_array['header']
+    header['magic'] = magic
+    header['version'] = protocol_version
+    header['flags'] = flags
+    header['client_ID'] = client_ID
+    header['sequence'] = np.asarray(sequences, dtype=np.int64) & 0xFFFFFFFF
+    header['blob_count'] = blob_counts
+    header['PTS'] = PTS
+
+    message_array['blobs'] = blobs.astype('<f4').view(blob_dtype)[..., 0]
+
+    message_bytes = message_array.tobytes()
+    message_sizes = header_size + blob_dtype.itemsize * np.asarray(blob_counts)
+
+    return [message_bytes[start:start + size] for start, size in zip(range(0, len(message_bytes), message_array.itemsize), message_sizes.tolist())]
+
+def decode_header(message_bytes):
+    # Returns the header fields (version, flags, client ID, sequence, blob count, PTS) or None if not a framed message
+    if not is_framed(message_bytes):
+        return None
+
+    return header_struct.unpack_from(message_bytes)[1:]
+
+def decode_message(message_bytes):
+    # Decode framed and legacy messages alike
+    # - Returns the client ID and sequence number (None for legacy messages), the flags, the PTS (None if undecodable)
+    #   and the blobs shaped (blob_count, 3) as [u, v, A] (None if corrupted)
+    header = decode_header(message_bytes)
+
+    if header is None: # Legacy message
+        # Empty message or size is not a multiple of float32
+        if not len(message_bytes) or len(message_bytes) % 4:
+            return None, None, 0, None, None
+
+        message = np.frombuffer(message_bytes, dtype=np.float32)
+        blobs = message[:-1].reshape(-1, 3) if (message.size - 1) % 3 == 0 else None
+
+        return None, None, 0, message[-1], blobs
+
+    version, flags, client_ID, sequence, blob_count, PTS = header
+
+    # Unknown version or size not matching the blob count
+    if version != protocol_version or len(message_bytes) != header_size + blob_dtype.itemsize * blob_count:
+        return client_ID, sequence, flags, None, None
+
+    blobs = np.frombuffer(message_bytes, dtype=np.float32, offset=header_size).reshape(-1, 3)
+
+    return client_ID, sequence, flags, PTS, blobs
+
+# Per-client sequence bookkeeping, counting lost, duplicated and reordered messages
+class SequenceTracker:
+    def __init__(self,
+                 n_clients=0,
+                 window=64 # Past sequence numbers remembered to tell duplicates from late messages
+                 ):
+
+        self.window = window
+
+        self.last = [None] * n_clients # Highest sequence number received from each client
+        self.history = [0] * n_clients # Bitmask of the received sequence numbers, bit k is last - k
+
+        self.received = np.zeros(n_clients, dtype=np.int64)
+        self.lost = np.zeros(n_clients, dtype=np.int64) # Skipped sequence numbers not received so far
+        self.duplicated = np.zeros(n_clients, dtype=np.int64)
+        self.reordered = np.zeros(n_clients, dtype=np.int64) # Messages received after a later one
+
+    def seen(self, ID, sequence):
+        # Whether the message was already received, without recording it
+        last = self.last[ID]
+
+        if last is None:
+            return False
+
+        age = (last - sequence) & 0xFFFFFFFF
+
+        return age < self.window and bool(self.history[ID] >> age & 1)
+
+    def update(self, ID, sequence):
+        # Returns False if the message was already received
+        last = self.last[ID]
+
+        if last is None:
+            self.last[ID] = sequence
+            self.history[ID] = 1
+            self.received[ID] += 1
+
+            return True
+
+        # Serial number arithmetic, so sequence numbers may wrap around
+        delta = (sequence - last) & 0xFFFFFFFF
+
+        if delta and delta < 0x80000000: # Ahead of the last message
+            self.lost[ID] += delta - 1
+            self.last[ID] = sequence
+            self.history[ID] = ((self.history[ID] << delta) | 1) & ((1 << self.window) - 1) if delta < self.window else 1
+
+        else:
+            age = (last - sequence) & 0xFFFFFFFF
+
+            if age < self.window and self.history[ID] >> age & 1:
+                self.duplicated[ID] += 1
+
+                return False
+
+            # Late message, fills a gap counted as lost (messages older than the window are taken as late too)
+            if age < self.window:
+                self.history[ID] |= 1 << age
+
+            self.lost[ID] = max(self.lost[ID] - 1, 0)
+            self.reordered[ID] += 1
+
+        self.received[ID] += 1
+
+        return True
+
+    @property
+    def statistics(self):
+        return {'received': int(self.received.sum()),
+                'lost': int(self.lost.sum()),
+                'duplicated': int(self.duplicated.sum()),
+                'reordered': int(self.reordered.sum())}
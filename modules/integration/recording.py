@@ -0,0 +1,361 @@
+# Importing modules...
+import struct
+import mmap
+import time
+import numpy as np
+
+from modules.integration.synthetic.emulator import ClientEmulator
+from modules.integration.protocol import *
+from modules.integration.ingest import DatagramIngest
+from modules.integration.capture import triangulate_available
+
+# Capture recordings: an append-only log of the datagram payloads and an index with one record per datagram
+# - Files are memory mapped and their headers keep the bytes in use, so a crashed session stays readable
+recording_version = 1
+
+log_magic = b'VMCAPLOG'
+index_magic = b'VMCAPIDX'
+
+# Header: magic, version, reserved and bytes in use after the header
+header_struct = struct.Struct('<8sIIQ')
+
+# Index record: payload offset in the log, payload size, client ID (-1 if unknown) and arrival time in seconds
+index_struct = struct.Struct('<QIid')
+index_dtype = np.dtype([('offset', '<u8'), ('length', '<u4'), ('client_ID', '<i4'), ('arrival', '<f8')])
+
+def recording_paths(path):
+    return f'{path}.log', f'{path}.idx'
+
+# Append-only file mapped in memory, doubling its size when full
+class MappedLog:
+    def __init__(self,
+                 path,
+                 magic,
+                 capacity=1 << 20 # Initial bytes after the header
+                 ):
+
+        self.magic = magic
+        self.used = 0
+
+        self.file = open(path, 'w+b')
+        self.file.truncate(header_struct.size + capacity)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+        self.update_header()
+
+    def update_header(self):
+        header_struct.pack_into(self.map, 0, self.magic, recording_version, 0, self.used)
+
+    def reserve(self, size):
+        # Offset of size free bytes, growing the file if needed
+        offset = header_struct.size + self.used
+
+        if offset + size > len(self.map):
+            new_size = len(self.map)
+
+            while offset + size > new_size:
+                new_size *= 2
+
+            self.map.close()
+            self.file.truncate(new_size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+
+        return offset
+
+    def append(self, data, align=8):
+        # Returns the offset of the data in the file, entries start aligned so payloads can be read as float arrays
+        size = len(data)
+        offset = self.reserve(-(-size // align) * align)
+
+        self.map[offset:offset + size] = data
+        self.used = offset + -(-size // align) * align - header_struct.size
+
+        return offset
+
+    def close(self):
+        # File is cut to the bytes in use
+        self.update_header()
+        self.map.flush()
+        self.map.close()
+
+        self.file.truncate(header_struct.size + self.used)
+        self.file.close()
+
+# Recorder of the raw client traffic of a capture
+class CaptureRecorder:
+    def __init__(self,
+                 path, # Recording path without extension, written as <path>.log and <path>.idx
+                 capacity=1 << 24 # Initial log size in bytes
+                 ):
+
+        log_path, index_path = recording_paths(path)
+
+        self.log = MappedLog(log_path, log_magic, capacity)
+        self.index = MappedLog(index_path, index_magic, max(capacity // 16, index_struct.size))
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def record(self, payload, ID=None, arrival=None):
+        # Payload is written first and published by its index record, so a crash never indexes a partial payload
+        if arrival is None:
+            arrival = time.monotonic()
+
+        offset = self.log.append(payload)
+        self.log.update_header()
+
+        index_offset = self.index.reserve(index_struct.size)
+        index_struct.pack_into(self.index.map, index_offset, offset, len(payload), -1 if ID is None else ID, arrival)
+
+        self.index.used += index_struct.size
+        self.index.update_header()
+
+        self.count += 1
+
+    def close(self):
+        self.log.close()
+        self.index.close()
+
+# Read-only view of a capture recording
+class CaptureLog:
+    def __init__(self,
+                 path # Recording path without extension
+                 ):
+
+        self.files, self.maps, used = [], [], []
+
+        for file_path, magic in zip(recording_paths(path), (log_magic, index_magic)):
+            file = open(file_path, 'rb')
+            file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            file_magic, version, _, file_used = header_struct.unpack_from(file_map)
+
+            if file_magic != magic or version != recording_version:
+                raise ValueError(f'{file_path} is not a version {recording_version} capture recording')
+
+            self.files.append(file)
+            self.maps.append(file_map)
+            used.append(file_used)
+
+        self.log_map = self.maps[0]
+
+        # Index records straight from the mapped file
+        self.index = np.frombuffer(self.maps[1], dtype=index_dtype, count=used[1] // index_dtype.itemsize, offset=header_struct.size)
+        self._messages = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.index.size
+
+    def __getitem__(self, record):
+        # Payload of a record, without copying
+        offset, length, _, _ = self.index[record].tolist()
+
+        return memoryview(self.log_map)[offset:offset + length]
+
+    @property
+    def n_clients(self):
+        client_IDs = self.index['client_ID']
+
+        return int(client_IDs.max()) + 1 if client_IDs.size and client_IDs.max() >= 0 else 0
+
+    def records(self, ID):
+        # Records of a client, in arrival order
+        return np.nonzero(self.index['client_ID'] == ID)[0]
+
+    @property
+    def messages(self):
+        # Records of a client that decode as a message, leaving out e.g. registration datagrams repeated during the capture
+        if self._messages is None:
+            self._messages = np.array([ID >= 0 and decode_message(self[record])[3] is not None
+                                       for record, ID in enumerate(self.index['client_ID'].tolist())], dtype=bool)
+
+        return self._messages
+
+    def message_logs(self, n_clients=None):
+        # Payloads of each client as bytes, the same as the message log of the clients in a capture
+        # - Undecodable payloads and framed duplicates are left out, as the capture pipelines do
+        n_clients = self.n_clients if n_clients is None else n_clients
+
+        message_logs = [[] for _ in range(n_clients)]
+        sequences = SequenceTracker(n_clients)
+
+        for record in np.nonzero(self.messages)[0]:
+            ID = int(self.index['client_ID'][record])
+            payload = bytes(self[record])
+            header = decode_header(payload)
+
+            if ID >= n_clients or (header is not None and not sequences.update(ID, header[3])):
+                continue
+
+            message_logs[ID].append(payload)
+
+        return message_logs
+
+    def close(self):
+        self.index = None
+
+        for file_map, file in zip(self.maps, self.files):
+            file_map.close()
+            file.close()
+
+        self.maps, self.files = [], []
+
+# Recorded client traffic streamed back to a capture server, with the recorded timing scaled by the replay speed
+# - Same registration, trigger and streaming as the emulated clients, with recorded messages instead of simulated ones
+# - Datagrams sent faster than the server reads them are dropped by its socket, see CaptureReplay for a lossless replay
+class CaptureReplayer(ClientEmulator):
+    def __init__(self,
+                 path, # Recording path without extension
+                 server_address=('127.0.0.1', 8888),
+                 mode='coppeliasim', # Registration semantics: 'coppeliasim' (ID message) or 'mocaprasp' (IP lookup and trigger)
+                 speed=1.0 # Replay speed factor, as fast as possible if None
+                 ):
+
+        self.log = CaptureLog(path)
+        self.n_clients = self.log.n_clients
+        self.server_address = server_address
+        self.mode = mode
+        self.speed = speed
+
+        self.sockets = []
+        self.capture_time = None
+        self.thread = None
+        self.statistics = {}
+
+    def close(self):
+        super().close()
+        self.log.close()
+
+    def schedule(self, start_time):
+        # Every message of a known client, sent after the same delay it arrived with
+        records = np.nonzero(self.log.messages)[0]
+        arrivals = self.log.index['arrival'][records]
+
+        send_times = np.full(records.size, float(start_time))
+
+        if self.speed is not None and records.size:
+            send_times += (arrivals - arrivals[0]) / self.speed
+
+        client_IDs = self.log.index['client_ID'][records].astype(np.int64)
+
+        self.statistics = {'scheduled': int(records.size)}
+
+        # Every client reads its messages from the same log, by record number
+        return [self.log] * self.n_clients, (send_times, client_IDs, records)
+
+# Recording fed straight to the ingestion of a capture, in recorded order and without sockets
+# - Deterministic: every recorded message reaches the synchronizers, so replays give the same results at any speed
+# - Same ring ingestion and synchronization as the ring path of CapturePipeline, with the triangulation index logic of its reconstruction
+class CaptureReplay:
+    def __init__(self,
+                 server, # Server with clients and their synchronizers set by a capture request
+                 path, # Recording path without extension
+                 step_delay=2 # Triangulation steps allowed to delay before skipping to the latest message
+                 ):
+
+        self.server = server
+        self.path = path
+        self.step_delay = step_delay
+
+        self.statistics = {}
+
+    def run(self):
+        # Returns the triangulated markers of each synchronized PTS
+        server = self.server
+
+        # Replayed clients are registered under placeholder addresses, which identify their legacy messages
+        server.client_addresses.clear()
+        server.client_addresses.update({('replay', ID): ID for ID in range(server.n_clients)})
+        server.sequences = SequenceTracker(server.n_clients)
+
+        synchronizer = server.clients[0].synchronizer
+        blob_count, step, max_T = synchronizer.blob_count, synchronizer.step, synchronizer.sync_PTS.size - 1
+
+        triangulated_markers = np.full((max_T + 1, 3, blob_count), np.nan)
+        statistics = {'received': 0, 'unknown_address': 0, 'decode_failed': 0, 'accepted': 0, 'refused': 0, 'triangulated': 0}
+
+        # Each message is synchronized right after it is written, so the rings never overwrite unread messages
+        ingest = DatagramIngest(server, capacity=1, message_logs=[client.message_log for client in server.clients])
+
+        # Same triangulation index logic as the capture loop of the virtual arena
+        T = 0 # Triangulation index
+        T_ = 0 # Ideal triangulation index
+
+        with CaptureLog(self.path) as log:
+            for record, (_, length, ID, arrival) in enumerate(log.index.tolist()):
+                statistics['received'] += 1
+
+                if ID < 0 or ID >= server.n_clients:
+                    statistics['unknown_address'] += 1
+                    continue
+
+                if length > len(ingest.staging_bytes):
+                    ingest.statistics['invalid_size'] += 1
+                    continue
+
+                ingest.staging_bytes[:length] = log[record]
+
+                if ingest.write(length, ('replay', ID), arrival) is None or not len(ingest.rings[ID]):
+                    continue
+
+                PTS, valid, accepted = ingest.synchronize(ID, blob_count)
+
+                if np.isnan(PTS[0]):
+                    statistics['decode_failed'] += 1
+                    continue
+
+                statistics['accepted' if accepted[0] else 'refused'] += 1
+
+                # Update ideal triangulation index
+                T_idx = int(np.rint(PTS[0] / step)) # Triangulation index of the message
+                T_ = T_ if T_idx < T_ else max_T if T_idx > max_T else T_idx
+
+                # Check for delay
+                if T_ - T > self.step_delay:
+                    T = T_ # If delay is exceeded, update triangulation index to last message
+
+                if not valid[0]:
+                    continue
+
+                sync_blobs = [client.synchronizer.sync_blobs[T] for client in server.clients]
+                available = [ID for ID, blobs in enumerate(sync_blobs) if np.any(blobs >= 0)] # Non-interpolated blobs are negative!
+
+                # If no pair is available to triangulate
+                if len(available) < 2:
+                    continue
+
+                markers = triangulate_available(server.multiple_view, sync_blobs, available)
+
+                if markers is not None:
+                    # A PTS triangulated again with more clients counts once
+                    if np.isnan(triangulated_markers[T]).all():
+                        statistics['triangulated'] += 1
+
+                    triangulated_markers[T] = markers
+
+                # Wait for every client to triangulate
+                elif len(available) < server.n_clients:
+                    continue
+
+                # Update to next triangulation index
+                T = max_T if T + 1 > max_T else T + 1 # Clip to valid indexes
+
+        statistics['decode_failed'] += ingest.statistics['invalid_size']
+
+        sequences = server.sequences.statistics
+        self.statistics = dict(statistics, lost=sequences['lost'], duplicated=sequences['duplicated'], reordered=sequences['reordered'])
+
+        return triangulated_markers
@@ -0,0 +1,216 @@
+# Importing modules...
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import copy
+import numpy as np
+
+from modules.integration.protocol import decode_message
+
+# Offline reprocessing of recorded client messages, split over clients and time chunks on a process pool
+# - Results are bit-identical to feeding every message to the synchronizer one at a time
+
+def decode_messages(messages, blob_count):
+    # PTS of each message (None if undecodable) and blob centroids of the messages with the expected blob count, with their mask
+    PTS = []
+    valid = np.zeros(len(messages), dtype=bool)
+    blob_centroids = []
+
+    for index, message_bytes in enumerate(messages):
+        _, _, _, message_PTS, blobs = decode_message(message_bytes)
+        PTS.append(message_PTS)
+
+        if message_PTS is not None and blobs is not None and blobs.shape[0] == blob_count:
+            valid[index] = True
+            blob_centroids.append(blobs[:, :2])
+
+    blob_centroids = np.array(blob_centroids, dtype=np.float32).reshape(-1, blob_count, 2)
+
+    return PTS, blob_centroids, valid
+
+def undistort_messages(camera, messages, blob_count):
+    # Decode and undistort a chunk of messages of a client, all blobs at once
+    PTS, blob_centroids, valid = decode_messages(messages, blob_count)
+
+    undistorted_blobs = camera.undistort_points(blob_centroids.reshape(-1, 2)).reshape(-1, blob_count, 2) if valid.any() else blob_centroids
+
+    # PTS are kept as decoded, so every comparison runs as in the synchronizer
+    return [PTS[index] for index in np.nonzero(valid)[0]], undistorted_blobs
+
+def accepted_messages(PTS, capture_time):
+    # Messages Synchronizer.add_data accepts: inside the capture time and strictly after the last accepted PTS
+    accepted = np.zeros(len(PTS), dtype=bool)
+    last_PTS = None
+
+    for index, message_PTS in enumerate(PTS):
+        if message_PTS > capture_time or (last_PTS is not None and message_PTS <= last_PTS):
+            continue
+
+        accepted[index] = True
+        last_PTS = message_PTS
+
+    return accepted
+
+def synchronize_chunk(synchronizer, PTS, blobs, interpolation_start, history=0):
+    # Feed accepted messages to a fresh synchronizer, the first history messages only fill the interpolation window
+    # - Returns the ordered blobs of every message, the synchronized PTS range interpolated and its blobs followed by the predicted ones
+    synchronizer = copy.deepcopy(synchronizer)
+    synchronizer.interpolation_start = interpolation_start
+
+    start = None
+    ordered_blobs = []
+
+    for index, (message_PTS, message_blobs) in enumerate(zip(PTS, blobs)):
+        if index == history:
+            start = synchronizer.interpolation_start
+
+        synchronizer.add_data(message_blobs, message_PTS)
+        ordered_blobs.append(last_blobs(synchronizer))
+
+    end = synchronizer.interpolation_start if start is not None else interpolation_start
+    start = interpolation_start if start is None else start
+
+    return (np.array(ordered_blobs).reshape(len(PTS), -1, 2), (start, end)) + synchronized(synchronizer, start, end)
+
+def last_blobs(synchronizer):
+    # Ordered blobs of the last accepted message, collected here since a bounded synchronizer history drops the older ones
+    return synchronizer.window(1)[1][0].copy()
+
+def synchronized(synchronizer, start, end):
+    # Synchronized blobs from start to end and the predictions after them, with their prediction flags
+    stop = end + np.count_nonzero(synchronizer.sync_predicted[end:end + synchronizer.prediction])
+
+    return synchronizer.sync_blobs[start:stop], synchronizer.sync_predicted[start:stop]
+
+def reprocess_serial(camera, synchronizer, messages):
+    # Reference path, one message at a time as in the capture loop
+    synchronizer = copy.deepcopy(synchronizer)
+
+    for message_bytes in messages:
+        PTS, blob_centroids, valid = decode_messages([message_bytes], synchronizer.blob_count)
+
+        if valid.any():
+            synchronizer.add_data(camera.undistort_points(blob_centroids[0]), PTS[0])
+
+    return synchronizer
+
+def row_permutation(blobs, reference):
+    # Permutation of the blob rows that turns blobs into the reference, None if they are not the same rows
+    blobs_order = np.lexsort(blobs.T[::-1])
+    reference_order = np.lexsort(reference.T[::-1])
+
+    permutation = np.empty_like(blobs_order)
+    permutation[reference_order] = blobs_order
+
+    return permutation if np.array_equal(blobs[permutation], reference) else None
+
+class Reprocessor:
+    def __init__(self,
+                 workers=None, # Worker processes, one per core by default
+                 chunk_size=2048, # Messages per chunk, at least the interpolation window
+                 context=None # Multiprocessing start method, the platform default by default
+                 ):
+
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.context = multiprocessing.get_context(context)
+
+    def reprocess(self, cameras, synchronizer, message_logs):
+        # Synchronize the message log of every client, returns a synchronizer per client
+        # - Message logs are lists of message bytes per client (see CaptureLog.message_logs for recordings)
+        window = synchronizer.interpolation_window
+        overlap = window - 1 # Messages before a chunk that complete its first interpolation window
+
+        with ProcessPoolExecutor(self.workers, mp_context=self.context) as executor:
+            # Decoding and undistortion are independent between messages
+            futures = [[executor.submit(undistort_messages, camera, messages[start:start + self.chunk_size], synchronizer.blob_count)
+                        for start in range(0, len(messages), self.chunk_size)]
+                       for camera, messages in zip(cameras, message_logs)]
+
+            streams = []
+
+            for client_futures in futures:
+                PTS, blobs = [], []
+
+                for future in client_futures:
+                    chunk_PTS, chunk_blobs = future.result()
+                    PTS += chunk_PTS
+                    blobs.append(chunk_blobs)
+
+                blobs = np.concatenate(blobs) if blobs else np.zeros((0, synchronizer.blob_count, 2), dtype=np.float32)
+
+                accepted = accepted_messages(PTS, synchronizer.capture_time)
+                streams.append(([PTS[index] for index in np.nonzero(accepted)[0]], blobs[accepted]))
+
+            # Interpolation chunks only depend on the previous messages through the window and the blob order
+            # - The window comes from the overlap, the order is fixed afterwards since proximity ordering is equivariant to row permutations
+            futures = []
+
+            for PTS, blobs in streams:
+                client_futures = []
+
+                for start in range(0, len(PTS), self.chunk_size):
+                    history = min(start, overlap)
+                    first = start - history
+
+                    client_futures.append(executor.submit(synchronize_chunk, synchronizer,
+                                                          PTS[first:start + self.chunk_size], blobs[first:start + self.chunk_size],
+                                                          self.interpolation_start(synchronizer, PTS, start), history))
+
+                futures.append(client_futures)
+
+            return [self.stitch(synchronizer, PTS, blobs, [future.result() for future in client_futures], overlap)
+                    for (PTS, blobs), client_futures in zip(streams, futures)]
+
+    def interpolation_start(self, synchronizer, PTS, start):
+        # Interpolation start left by the message before the chunk, computed as in Synchronizer.add_data (raw PTS are kept in float64)
+        if start < synchronizer.interpolation_window:
+            return 0
+
+        return int(np.float64(PTS[start - 1]) // synchronizer.step) + 1
+
+    def stitch(self, synchronizer, PTS, blobs, chunks, overlap):
+        synchronizer = copy.deepcopy(synchronizer)
+        ordered_blobs = []
+
+        for index, (chunk_blobs, (start, end), sync_blobs, sync_predicted) in enumerate(chunks):
+            first = index * self.chunk_size
+            history = min(first, overlap)
+
+            if history:
+                # Blob order of the chunk, matched against the order of the same messages in the previous chunk
+                permutation = row_permutation(chunk_blobs[0], ordered_blobs[first - history])
+
+                if permutation is None or not np.array_equal(chunk_blobs[:history, permutation], np.array(ordered_blobs[first - history:first])):
+                    # Assignment ties broke the equivariance, the chunk is redone in order
+                    chunk_blobs, (start, end), sync_blobs, sync_predicted = self.resume(synchronizer, PTS, blobs, ordered_blobs, first)
+                    permutation = slice(None)
+
+                chunk_blobs = chunk_blobs[:, permutation]
+                sync_blobs = sync_blobs[:, permutation]
+
+            # Predictions of a chunk are replaced by the next one, as they would be by the next messages
+            ordered_blobs += list(chunk_blobs[history:])
+            synchronizer.sync_blobs[start:start + len(sync_blobs)] = sync_blobs
+            synchronizer.sync_predicted[start:start + len(sync_predicted)] = sync_predicted
+            synchronizer.interpolation_start = end
+
+        synchronizer.load_history(PTS, ordered_blobs)
+
+        return synchronizer
+
+    def resume(self, synchronizer, PTS, blobs, ordered_blobs, first):
+        # Serial chunk, continuing from the ordered blobs of the previous messages
+        history = min(first, synchronizer.interpolation_window - 1)
+
+        synchronizer = copy.deepcopy(synchronizer)
+        synchronizer.load_history(PTS[first - history:first], ordered_blobs[first - history:first])
+        synchronizer.interpolation_start = start = self.interpolation_start(synchronizer, PTS, first)
+        chunk_blobs = [ordered_blobs[index] for index in range(first - history, first)]
+
+        for message_PTS, message_blobs in zip(PTS[first:first + self.chunk_size], blobs[first:first + self.chunk_size]):
+            synchronizer.add_data(message_blobs, message_PTS)
+            chunk_blobs.append(last_blobs(synchronizer))
+
+        end = synchronizer.interpolation_start
+
+        return (np.array(chunk_blobs).reshape(-1, synchronizer.blob_count, 2), (start, end)) + synchronized(synchronizer, start, end)
@@ -1,14 +1,21 @@
 import os
 import copy
-import pickle
 from datetime import datetime
 
 from modules.vision.multiple_view import *
 from modules.vision.synchronizer import *
 from modules.integration.client import *
 from modules.integration.UDP import *
+from modules.integration.protocol import *
+from modules.integration.calibration import *
+from modules.integration.capture import *
+from modules.integration.multiprocess import *
+from modules.integration.reprocessing import *
+from modules.integration.recording import *
 
 class Server: 
+    camera_type = Camera # Camera model rebuilt when loading calibrations
+
     def __init__(self, 
                  clients = [],
                  address = ('127.0.0.1', 8888)
@@ -21,11 +28,12 @@ class Server:
         self.address = address
         self.udp_socket = UDP(self.address)
 
-    def update_clients(self, clients):
+    def update_clients(self, clients, copy_clients=True):
         # Associated clients
-        self.clients = copy.deepcopy(clients)     
+        self.clients = copy.deepcopy(clients) if copy_clients else list(clients)
         self.n_clients = len(self.clients)
         self.client_addresses = {}
+        self.sequences = SequenceTracker(self.n_clients) # Lost, duplicated and reordered framed messages
 
         # Create Multiple View only if all clients have an associated camera model
         self.multiple_view = None
@@ -44,29 +52,100 @@ class Server:
         if not os.path.exists(directory):
             os.makedirs(directory, exist_ok=True)
 
-        # Save data to pickle file
-        for C, camera_model in enumerate(self.multiple_view.camera_models):
-            # Save the object to a file (Pickling)
-            try:
-                with open(os.path.join(directory, f'{C}.pkl'), 'wb') as file:
-                    pickle.dump(camera_model, file)
-            except:
-                continue
+        # Save camera model parameters to a single file
+        save_cameras(os.path.join(directory, calibration_file), self.multiple_view.camera_models)
+
+        return directory
 
     def load_calibration(self, path):
-        clients = []
-        for C in range(len(os.listdir(path))):
-            # Load the object from the file (Unpickling)
-            try:
-                with open(os.path.join(path, f'{C}.pkl'), 'rb') as file:
-                    camera = pickle.load(file)
-                    clients.append(Client(camera=camera))
-            
-            except:
-                continue
+        # Path may be the calibration file itself or its directory
+        if os.path.isdir(path):
+            calibration_path = os.path.join(path, calibration_file)
 
-        self.update_clients(clients)
+        else:
+            calibration_path = path
+
+        if os.path.isfile(calibration_path):
+            camera_models = load_cameras(calibration_path, self.camera_type)
+
+        else: # Calibrations saved as pickled camera models
+            camera_models = load_legacy_cameras(path)
+
+        # Freshly loaded clients do not need to be copied
+        self.update_clients([Client(camera=camera) for camera in camera_models], copy_clients=False)
+
+    async def capture(self, **kwargs):
+        # Non-blocking capture from the registered clients, after a capture request
+        # - Returns the triangulated markers of each synchronized PTS (see CapturePipeline for the options)
+        self.capture_pipeline = CapturePipeline(self, **kwargs)
+
+        return await self.capture_pipeline.run()
+
+    def prepare_processes(self, synchronizer=None, **kwargs):
+        # Start the worker processes of a capture ahead of the client registration, so no message waits for them
+        # - Synchronizer of the upcoming capture request, the one of the clients by default (see ProcessPipeline for the options)
+        # - Returns the started pipeline, to be passed to capture_processes
+        pipeline = ProcessPipeline(self, synchronizer, **kwargs)
+        pipeline.start()
+
+        return pipeline
+
+    def capture_processes(self, pipeline=None, **kwargs):
+        # Capture from the registered clients with preprocessing and reconstruction in worker processes, after a capture request
+        # - Runs a pipeline from prepare_processes if given, a new one otherwise
+        # - Returns the triangulated markers of each synchronized PTS (see ProcessPipeline for the options)
+        if pipeline is not None and kwargs:
+            raise ValueError('Options of a prepared pipeline are set by prepare_processes')
+
+        self.capture_pipeline = pipeline if pipeline is not None else ProcessPipeline(self, **kwargs)
+
+        return self.capture_pipeline.run()
+
+    def replay(self, path, **kwargs):
+        # Capture from a recording instead of the clients, without sockets, after a capture request
+        # - Returns the triangulated markers of each synchronized PTS (see CaptureReplay for the options)
+        self.capture_pipeline = CaptureReplay(self, path, **kwargs)
+
+        return self.capture_pipeline.run()
+
+    def reprocess(self, synchronizer, message_logs=None, **kwargs):
+        # Synchronize the message logs again offline, e.g. with other synchronizer parameters (see Reprocessor for the options)
+        # - Message logs of the clients by default
+        if message_logs is None:
+            message_logs = [client.message_log for client in self.clients]
+
+        synchronizers = Reprocessor(**kwargs).reprocess([client.camera for client in self.clients], synchronizer, message_logs)
+
+        for client, client_synchronizer in zip(self.clients, synchronizers):
+            client.synchronizer = client_synchronizer
+
+        return synchronizers
+
+    def identify(self, message_bytes, address):
+        # Client ID from the header of framed messages, from the registered source address of legacy messages
+        # - Returns the client ID (None if unknown) and whether the message was already received
+        header = decode_header(message_bytes)
+
+        if header is None:
+            return self.client_addresses.get(address), False
+
+        _, _, ID, sequence, _, _ = header
+
+        if ID >= self.n_clients:
+            return None, False
+
+        return ID, not self.sequences.update(ID, sequence)
 
+    def decode_message(self, message_bytes, blob_count):
+        # Valid message is [u, v, A] per blob and the PTS of the message, framed (see protocol.py) or legacy float32
+        # - Returns the blob centroids (None if the blob count does not match) and the PTS (None if undecodable)
+        _, _, _, PTS, blobs = decode_message(message_bytes)
 
+        # No blobs were detected, wrong blob count or corrupted message
+        if PTS is None or blobs is None or blobs.shape[0] != blob_count:
+            return None, PTS
 
+        # Extracting blob centroids, ignoring their area
+        blob_centroids = blobs[:, :2]
 
+        return blob_centroids, PTS
@@ -0,0 +1,220 @@
+# Importing modules...
+import threading
+import select
+import socket
+import time
+import numpy as np
+
+from modules.integration.UDP import *
+from modules.integration.synthetic.simulation import *
+
+# Virtual clients streaming simulated blob messages to a capture server over UDP
+class ClientEmulator:
+    def __init__(self,
+                 cameras=[], # Camera model of each virtual client, indexed by client ID
+                 trajectory=None, # Marker positions shaped (timesteps, markers, 3), one timestep per message
+                 server_address=('127.0.0.1', 8888),
+                 mode='coppeliasim', # Registration semantics: 'coppeliasim' (ID message) or 'mocaprasp' (IP lookup and trigger)
+                 rate=100, # Messages per second of each client
+                 jitter=0.0, # Standard deviation of the send time of each message in seconds
+                 loss=0.0, # Probability of a message being dropped
+                 reorder=0.0, # Probability of a message being swapped with the next one of the same client
+                 duplicate=0.0, # Probability of a message being sent twice
+                 framed=True, # Versioned binary messages with sequence numbers (see protocol.py), legacy float32 messages otherwise
+                 simulation=None, # AnalyticSimulation generating the messages, built for the cameras by default
+                 seed=None
+                 ):
+
+        self.cameras = list(cameras)
+        self.n_clients = len(self.cameras)
+        self.trajectory = np.asarray(trajectory, dtype=np.float64)
+        self.server_address = server_address
+        self.mode = mode
+        self.rate = rate
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.framed = framed
+
+        self.generator = np.random.default_rng(seed)
+        self.simulation = simulation if simulation is not None else AnalyticSimulation(self.cameras, seed=self.generator.integers(2**32))
+
+        # Presentation timestamps of the trajectory samples
+        self.PTS = np.arange(self.trajectory.shape[0]) / self.rate
+
+        self.sockets = []
+        self.capture_time = None
+        self.thread = None
+        self.statistics = {}
+
+    def __enter__(self):
+        self.open()
+
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    @property
+    def client_ips(self):
+        # Client IPs as resolved by MoCapRasp_Server
+        return {f'127.0.0.{ID + 2}': ID for ID in range(self.n_clients)}
+
+    def open(self):
+        # One socket per client, each client in its own loopback IP when the server tells clients apart by IP
+        for ID in range(self.n_clients):
+            ip = f'127.0.0.{ID + 2}' if self.mode == 'mocaprasp' else self.server_address[0]
+
+            udp_socket = UDP((ip, 0)) # Any free port
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+
+            self.sockets.append(udp_socket)
+
+    def close(self):
+        if self.thread is not None:
+            self.thread.join()
+
+        for udp_socket in self.sockets:
+            udp_socket.close()
+
+        self.sockets = []
+
+    def register(self, repeats=3, interval=0.01):
+        # Registration messages are not acknowledged, so they are repeated to survive drops
+        for _ in range(repeats):
+            for ID, udp_socket in enumerate(self.sockets):
+                # CoppeliaSim clients identify themselves, MoCapRasp clients are identified by their IP
+                message = str(ID) if self.mode == 'coppeliasim' else 'Hello'
+
+                udp_socket.sendto(message.encode(), self.server_address)
+
+            time.sleep(interval)
+
+    def wait_trigger(self, timeout=None):
+        # MoCapRasp trigger: '<start time> <capture time>', sent by the server to every client
+        start_times = {}
+        deadline = None if timeout is None else time.time() + timeout
+
+        while len(start_times) < self.n_clients:
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            readable, _, _ = select.select(self.sockets, [], [], remaining)
+
+            if not readable:
+                return None # Timed out
+
+            for udp_socket in readable:
+                message_bytes, _ = udp_socket.recvfrom(1024)
+
+                try:
+                    start_time, capture_time = message_bytes.decode().split()
+
+                except ValueError: # Invalid trigger
+                    continue
+
+                start_times[udp_socket] = float(start_time)
+                self.capture_time = float(capture_time)
+
+        return max(start_times.values())
+
+    def schedule(self, start_time):
+        # Messages of every client, with the send time of each of them
+        messages = self.simulation.simulate_messages(self.trajectory, self.PTS, self.framed)
+        n_timesteps = len(self.PTS)
+
+        # Only the messages inside the capture time are sent
+        if self.capture_time is not None:
+            n_timesteps = min(n_timesteps, int(np.ceil(self.capture_time * self.rate)))
+
+        client_IDs, indices = np.indices((self.n_clients, n_timesteps)).reshape(2, -1)
+
+        send_times = start_time + indices / self.rate
+
+        if self.jitter:
+            send_times += self.generator.normal(0, self.jitter, send_times.shape)
+
+        send_times = send_times.reshape(self.n_clients, n_timesteps)
+        indices = indices.reshape(self.n_clients, n_timesteps)
+
+        # Reordering: swap the send times of a message and the next one of the same client
+        swapped = self.generator.random((self.n_clients, n_timesteps - 1)) < self.reorder if n_timesteps > 1 else np.zeros((self.n_clients, 0), dtype=bool)
+        swapped[:, 1:] &= ~swapped[:, :-1] # No chained swaps
+
+        c, k = np.nonzero(swapped)
+        send_times[c, k], send_times[c, k + 1] = send_times[c, k + 1], send_times[c, k].copy()
+
+        # Lost messages are never sent, duplicated messages are sent again right after
+        kept = self.generator.random((self.n_clients, n_timesteps)) >= self.loss
+        repeated = kept & (self.generator.random((self.n_clients, n_timesteps)) < self.duplicate)
+
+        send_times = np.concatenate((send_times[kept], send_times[repeated]))
+        client_IDs = client_IDs.reshape(self.n_clients, n_timesteps)
+        client_IDs = np.concatenate((client_IDs[kept], client_IDs[repeated]))
+        indices = np.concatenate((indices[kept], indices[repeated]))
+
+        order = np.argsort(send_times, kind='stable')
+
+        events = (send_times[order], client_IDs[order], indices[order])
+
+        self.statistics = {'scheduled': self.n_clients * n_timesteps,
+                           'dropped': int(np.count_nonzero(~kept)),
+                           'reordered': int(swapped.sum()),
+                           'duplicated': int(np.count_nonzero(repeated))}
+
+        return messages, events
+
+    def stream(self, start_time=None):
+        if start_time is None:
+            start_time = time.time()
+
+        messages, (send_times, client_IDs, indices) = self.schedule(start_time)
+
+        sent = 0
+        late = 0.0
+
+        for send_time, ID, index in zip(send_times.tolist(), client_IDs.tolist(), indices.tolist()):
+            delay = send_time - time.time()
+
+            if delay > 0:
+                time.sleep(delay)
+
+            else:
+                late = max(late, -delay) # Falling behind the requested rate
+
+            try:
+                self.sockets[ID].sendto(messages[ID][index], self.server_address)
+                sent += 1
+
+            except OSError: # Full socket buffer, counted as a drop
+                continue
+
+        self.statistics.update({'sent': sent, 'max_lateness': late})
+
+        return self.statistics
+
+    def run(self, start_delay=0.1, trigger_timeout=None):
+        # Complete client behaviour: registration, trigger (MoCapRasp only) and streaming
+        self.register()
+
+        if self.mode == 'mocaprasp':
+            start_time = self.wait_trigger(trigger_timeout)
+
+            if start_time is None:
+                return None
+
+        else:
+            start_time = time.time() + start_delay
+
+        return self.stream(start_time)
+
+    def start(self, **kwargs):
+        # Run the clients in the background
+        self.thread = threading.Thread(target=self.run, kwargs=kwargs, daemon=True)
+        self.thread.start()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        return self.statistics
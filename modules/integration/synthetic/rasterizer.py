@@ -0,0 +1,184 @@
+# Importing modules...
+import numpy as np
+
+# Headless renderer of spherical markers, a local stand-in for the CoppeliaSim Vision Sensors
+# - Images are pinhole images (the lens distortion and noise models are applied afterwards by the cameras)
+class MarkerRasterizer:
+    def __init__(self,
+                 cameras=[], # Camera models to render for
+                 marker_radius=0.01, # Marker radius in meters
+                 intensity=255, # Marker brightness
+                 near=0.01, # Near clipping plane in meters (same as the CoppeliaSim Vision Sensors)
+                 far=10, # Far clipping plane in meters
+                 antialiasing=True # Shade the marker borders by their pixel coverage
+                 ):
+
+        self.cameras = list(cameras)
+        self.marker_radius = marker_radius
+        self.intensity = intensity
+        self.near = near
+        self.far = far
+        self.antialiasing = antialiasing
+
+    def footprints(self, camera, trajectory):
+        # Marker centers in the camera reference, shaped (timesteps, markers, 3)
+        trajectory_h = np.concatenate((trajectory, np.ones(trajectory.shape[:-1] + (1,))), axis=-1)
+        centers = trajectory_h @ np.asarray(camera.extrinsic_matrix, dtype=np.float64)[:3].T
+
+        # Markers entirely between the clipping planes
+        visible = (centers[..., 2] - self.marker_radius > self.near) & (centers[..., 2] + self.marker_radius < self.far)
+        centers = centers[visible]
+
+        # A sphere is seen inside the cone of rays d tangent to it: (d.C)^2 - |d|^2 (|C|^2 - R^2) >= 0
+        # - With d = K^-1 p, this is the conic p^T A p >= 0 over the pixels p
+        inverse_intrinsic = np.linalg.inv(np.asarray(camera.intrinsic_matrix, dtype=np.float64))
+        c0 = np.sum(centers * centers, axis=-1) - self.marker_radius**2
+
+        cone = centers[:, :, None] * centers[:, None, :] - c0[:, None, None] * np.eye(3)
+        conics = inverse_intrinsic.T @ cone @ inverse_intrinsic
+
+        # Bounding box of the ellipses from their dual conics (tangent lines u = k and v = k)
+        dual_conics = np.linalg.inv(conics)
+        dual_conics /= dual_conics[:, 2:3, 2:3]
+
+        half_u = np.sqrt(np.maximum(dual_conics[:, 0, 2]**2 - dual_conics[:, 0, 0], 0))
+        half_v = np.sqrt(np.maximum(dual_conics[:, 1, 2]**2 - dual_conics[:, 1, 1], 0))
+
+        # One pixel margin for the antialiased borders
+        bounding_boxes = np.stack((np.floor(dual_conics[:, 0, 2] - half_u) - 1,
+                                   np.floor(dual_conics[:, 1, 2] - half_v) - 1,
+                                   np.ceil(dual_conics[:, 0, 2] + half_u) + 2,
+                                   np.ceil(dual_conics[:, 1, 2] + half_v) + 2), axis=-1)
+
+        # Clip to the image
+        bounding_boxes = np.clip(bounding_boxes, 0, np.tile(camera.resolution, 2)).astype(np.intp)
+
+        return np.nonzero(visible)[0], centers, c0, inverse_intrinsic, bounding_boxes
+
+    def rasterize(self, centers, c0, inverse_intrinsic, bounding_boxes, size):
+        # Pixels of each bounding box, padded to a size x size window
+        offsets = np.arange(size)
+        u = bounding_boxes[:, 0, None, None] + offsets[None, None, :]
+        v = bounding_boxes[:, 1, None, None] + offsets[None, :, None]
+        u, v = np.broadcast_arrays(u, v)
+
+        in_box = (u < bounding_boxes[:, 2, None, None]) & (v < bounding_boxes[:, 3, None, None])
+
+        # Ray of each pixel: d = K^-1 [u, v, 1]
+        k_u, k_v, k_1 = inverse_intrinsic.T
+        rays = [k_u[i] * u + k_v[i] * v + k_1[i] for i in range(3)]
+
+        # Tangent cone test
+        a = sum(ray * centers[:, i, None, None] for i, ray in enumerate(rays)) # d.C
+        b = sum(ray * ray for ray in rays) # |d|^2
+        discriminant = a * a - b * c0[:, None, None]
+
+        if self.antialiasing:
+            # Pixel coverage from the signed distance to the border, approximated by the discriminant over its gradient
+            a_u, a_v = centers @ k_u, centers @ k_v
+            gradient_u = 2 * a * a_u[:, None, None] - 2 * c0[:, None, None] * sum(ray * k_u[i] for i, ray in enumerate(rays))
+            gradient_v = 2 * a * a_v[:, None, None] - 2 * c0[:, None, None] * sum(ray * k_v[i] for i, ray in enumerate(rays))
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                coverage = np.clip(0.5 + discriminant / np.hypot(gradient_u, gradient_v), 0, 1)
+
+            coverage[~np.isfinite(coverage)] = 1 # Pixel at the center of the footprint
+
+        else:
+            coverage = (discriminant >= 0).astype(np.float64)
+
+        # Depth of the first intersection of the ray with the sphere (the closest point of the ray at the borders)
+        depths = (a - np.sqrt(np.maximum(discriminant, 0))) / b
+
+        drawn = in_box & (coverage > 0)
+
+        return u[drawn], v[drawn], depths[drawn], coverage[drawn], np.nonzero(drawn)[0]
+
+    def render_camera(self, camera, trajectory, images=None):
+        # Marker positions shaped (timesteps, markers, 3) in the world reference
+        trajectory = np.asarray(trajectory, dtype=np.float64)
+        n_timesteps = trajectory.shape[0]
+        width, height = camera.resolution
+
+        if images is None:
+            images = np.zeros((n_timesteps, height, width), dtype=np.uint8)
+
+        else:
+            images[:] = 0
+
+        # Timestep of every visible marker and its footprint
+        timesteps, centers, c0, inverse_intrinsic, bounding_boxes = self.footprints(camera, trajectory)
+
+        # Markers are rasterized in batches of similar footprint sizes, padded to the next power of two
+        box_sizes = np.maximum(bounding_boxes[:, 2] - bounding_boxes[:, 0], bounding_boxes[:, 3] - bounding_boxes[:, 1])
+        drawable = box_sizes > 0
+        window_sizes = np.zeros_like(box_sizes)
+        window_sizes[drawable] = 2**np.ceil(np.log2(box_sizes[drawable])).astype(np.intp)
+
+        pixels, depths, values, marker_indices = [], [], [], []
+
+        for size in np.unique(window_sizes[drawable]):
+            batch = np.nonzero(window_sizes == size)[0]
+
+            u, v, batch_depths, coverage, markers = self.rasterize(centers[batch], c0[batch], inverse_intrinsic, bounding_boxes[batch], size)
+
+            pixels.append((timesteps[batch][markers] * height + v) * width + u)
+            depths.append(batch_depths)
+            values.append(np.round(coverage * self.intensity).astype(np.uint8))
+            marker_indices.append(batch[markers])
+
+        if not pixels:
+            return images
+
+        pixels, depths, values, marker_indices = (np.concatenate(pixels), np.concatenate(depths), 
+                                                  np.concatenate(values), np.concatenate(marker_indices))
+
+        # Markers whose footprints do not overlap any other marker of the same timestep are drawn straight away
+        overlapping = self.overlapping(timesteps, bounding_boxes, n_timesteps, trajectory.shape[1])[marker_indices]
+
+        images.reshape(-1)[pixels[~overlapping]] = values[~overlapping]
+
+        # Depth test: each pixel shows the closest marker
+        pixels, depths, values = pixels[overlapping], depths[overlapping], values[overlapping]
+
+        order = np.lexsort((depths, pixels))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = pixels[order[1:]] != pixels[order[:-1]]
+
+        closest = order[first]
+        images.reshape(-1)[pixels[closest]] = values[closest]
+
+        return images
+
+    def overlapping(self, timesteps, bounding_boxes, n_timesteps, n_markers):
+        # Bounding boxes of each timestep, padded to the number of markers
+        slots = np.arange(timesteps.size) - np.searchsorted(timesteps, timesteps)
+
+        boxes = np.zeros((n_timesteps, n_markers, 4), dtype=np.intp)
+        boxes[timesteps, slots] = bounding_boxes
+
+        # Pairwise intersection of the bounding boxes (padded boxes are empty)
+        u_min, v_min, u_max, v_max = np.moveaxis(boxes, -1, 0)
+
+        intersections = ((np.maximum(u_min[:, :, None], u_min[:, None, :]) < np.minimum(u_max[:, :, None], u_max[:, None, :])) & 
+                         (np.maximum(v_min[:, :, None], v_min[:, None, :]) < np.minimum(v_max[:, :, None], v_max[:, None, :])))
+        
+        intersections[:, np.arange(n_markers), np.arange(n_markers)] = False
+
+        return intersections.any(axis=-1)[timesteps, slots]
+
+    def render(self, trajectory):
+        # Pinhole images of every camera, each shaped (timesteps, height, width)
+        return [self.render_camera(camera, trajectory) for camera in self.cameras]
+
+    def vision_sensor_method(self, images, timestep):
+        # Stand-in for sim.getVisionSensorImg serving rendered images
+        # - Images are flipped back to CoppeliaSim's bottom to top order, Vision Sensor handles index the cameras
+        handles = {getattr(camera, 'vision_sensor_handle', ID): ID for ID, camera in enumerate(self.cameras)}
+
+        def api_method(handle, grayscale):
+            ID = handles[handle]
+
+            return images[ID][timestep][::-1].tobytes(), self.cameras[ID].resolution
+
+        return api_method
@@ -0,0 +1,121 @@
+# Importing modules...
+import numpy as np
+
+from modules.vision.lens_distortion import distort_points
+from modules.vision.centroid_noise import CentroidNoiseModel
+from modules.vision.blob_detection import params
+from modules.integration.protocol import encode_messages
+
+def project_markers(cameras, trajectory):
+    # Marker positions shaped (timesteps, markers, 3) in the world reference
+    trajectory = np.asarray(trajectory, dtype=np.float64)
+    trajectory_h = np.concatenate((trajectory, np.ones(trajectory.shape[:-1] + (1,))), axis=-1) # Convert to homogeneous
+
+    # Project every marker of every timestep to every camera at once, shaped (cameras, timesteps, markers, 3)
+    projection_matrices = np.stack([camera.projection_matrix for camera in cameras])
+    projected_points = np.einsum('cij,tmj->ctmi', projection_matrices, trajectory_h)
+
+    # Last homogeneous coordinate is the depth in the camera reference
+    depths = projected_points[..., 2]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        image_points = projected_points[..., :2] / depths[..., None] # Normalize homogeneous coordinates
+
+    return image_points, depths
+
+def pack_messages(blobs, visible, PTS, framed=False):
+    # Blobs shaped (cameras, timesteps, markers, 3) as [u, v, A], visibility shaped (cameras, timesteps, markers)
+    n_cameras, n_timesteps, n_markers = visible.shape
+
+    # Visible blobs first, sorted top to bottom as the detections of an image
+    order = np.lexsort((blobs[..., 0], np.where(visible, blobs[..., 1], np.inf)), axis=-1)
+    sorted_blobs = np.take_along_axis(blobs, order[..., None], axis=2)
+
+    blob_counts = np.count_nonzero(visible, axis=-1)
+
+    # Framed messages carry the client ID and the timestep as sequence number (see protocol.py)
+    if framed:
+        return [encode_messages(c, np.arange(n_timesteps), PTS, sorted_blobs[c], blob_counts[c]) for c in range(n_cameras)]
+
+    # Messages as sent by the clients: [u, v, A] per blob and the PTS of the message, in float32
+    # - Every message is laid out in a row with room for all markers and cut to its blob count
+    message_array = np.zeros((n_cameras, n_timesteps, 3 * n_markers + 1), dtype=np.float32)
+    message_array[..., :-1] = sorted_blobs.reshape(n_cameras, n_timesteps, -1)
+
+    camera_indices, timestep_indices = np.indices((n_cameras, n_timesteps))
+    message_array[camera_indices, timestep_indices, 3 * blob_counts] = np.broadcast_to(PTS, (n_cameras, n_timesteps))
+
+    return [[message_array[c, t, :3 * blob_counts[c, t] + 1].tobytes() for t in range(n_timesteps)]
+            for c in range(n_cameras)]
+
+# Image-free capture simulation, from marker trajectories straight to noisy blob centroids
+class AnalyticSimulation:
+    def __init__(self,
+                 cameras=[], # Camera models of the simulated clients
+                 marker_radius=0.01, # Marker radius in meters
+                 near=0.01, # Near clipping plane in meters (same as the CoppeliaSim Vision Sensors)
+                 far=10, # Far clipping plane in meters
+                 noise_model=None, # CentroidNoiseModel, calibrated against the simple blob detector by default
+                 seed=None # Seed of the centroid noise and detection dropouts
+                 ):
+
+        self.cameras = list(cameras)
+        self.marker_radius = marker_radius
+        self.near = near
+        self.far = far
+
+        self.noise_model = noise_model if noise_model is not None else CentroidNoiseModel()
+        self.generator = np.random.default_rng(seed)
+
+        # Smallest blob that passes the area filter of the blob detectors
+        self.min_diameter = 2 * np.sqrt(params.minArea / np.pi) if params.filterByArea else 0
+
+    def simulate(self, trajectory):
+        image_points, depths = project_markers(self.cameras, trajectory)
+
+        # Per camera parameters, broadcast against (cameras, timesteps, markers)
+        focal_lengths = np.array([(camera.intrinsic_matrix[0][0] + camera.intrinsic_matrix[1][1]) / 2 for camera in self.cameras])[:, None, None]
+        widths = np.array([camera.resolution[0] for camera in self.cameras])[:, None, None]
+        heights = np.array([camera.resolution[1] for camera in self.cameras])[:, None, None]
+        snr_dB = np.array([camera.snr_dB for camera in self.cameras], dtype=np.float64)[:, None, None]
+
+        # Markers between the clipping planes and inside the pinhole image
+        # - Culled before distortion, since distortion models can fold points far out of the image back into it
+        in_front = (depths > self.near) & (depths < self.far)
+
+        with np.errstate(invalid='ignore'):
+            pinhole_u, pinhole_v = image_points[..., 0], image_points[..., 1]
+            in_view = in_front & (pinhole_u >= 0) & (pinhole_u <= widths - 1) & (pinhole_v >= 0) & (pinhole_v <= heights - 1)
+
+        # Apparent marker diameter in pixels, as the blob size reported by the detectors
+        diameters = np.where(in_front, 2 * focal_lengths * self.marker_radius / np.where(in_front, depths, 1), 0)
+
+        blobs = np.empty(depths.shape + (3,))
+        blobs[..., 2] = diameters
+
+        # Lens distortion of each camera, over all timesteps at once
+        for c, camera in enumerate(self.cameras):
+            blobs[c, ..., :2] = distort_points(np.where(in_view[c, ..., None], image_points[c], 0),
+                                               camera.intrinsic_matrix,
+                                               camera.distortion_model,
+                                               camera.distortion_coefficients)
+
+        # Centroid noise and detection dropouts of the image pipeline
+        sigma = self.noise_model.sigma(snr_dB, diameters)
+        detected = self.generator.random(depths.shape) < self.noise_model.detection_rate(snr_dB, diameters)
+
+        blobs[..., :2] += sigma[..., None] * self.generator.standard_normal(blobs[..., :2].shape)
+
+        # Markers detected inside the image
+        u, v = blobs[..., 0], blobs[..., 1]
+        inside = (u >= 0) & (u <= widths - 1) & (v >= 0) & (v <= heights - 1)
+
+        visible = in_view & inside & (diameters >= self.min_diameter) & detected
+
+        return blobs, visible
+
+    def simulate_messages(self, trajectory, PTS, framed=False):
+        # Client messages of each camera for every timestep of the trajectory
+        blobs, visible = self.simulate(trajectory)
+
+        return pack_messages(blobs, visible, PTS, framed)
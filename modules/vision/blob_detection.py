@@ -1,6 +1,7 @@
 # Importing modules...
 import numpy as np
 import cv2
+from scipy.optimize import linear_sum_assignment
 
 params = cv2.SimpleBlobDetector_Params()
 
@@ -29,7 +30,11 @@ params.filterByConvexity   = False
 # Instanciate marker detector object
 marker_detector = cv2.SimpleBlobDetector_create(params)
 
-def detect_blobs(image, area=False, detector=marker_detector):
+def detect_blobs(image, area=False, detector=marker_detector, backend='simple'):
+    # Connected components backend
+    if backend == 'connected':
+        return detect_blobs_connected(image, area=area)
+
     # Apply threshold to image
     thresh = 127
     _, image_thresh = cv2.threshold(image, thresh, 255, cv2.THRESH_BINARY_INV)
@@ -68,4 +73,256 @@ def detect_blobs(image, area=False, detector=marker_detector):
         blob_areas = np.array([k.size for k in keypoints])
         detected_blobs = np.hstack((detected_blobs, blob_areas.reshape(-1, 1)))
 
-    return detected_blobs
\ No newline at end of file
+    return detected_blobs
+
+def blob_moments(image, blob_mask):
+    # Intensity weighted moments of a single blob, in the blob's sub-image reference
+    v, u = np.nonzero(blob_mask)
+    weights = image[v, u].astype(np.float64)
+
+    # Centroid
+    m00 = np.sum(weights)
+    u_c, v_c = np.sum(weights * u) / m00, np.sum(weights * v) / m00
+
+    # Normalized central moments
+    du, dv = u - u_c, v - v_c
+    mu20 = np.sum(weights * du * du) / m00
+    mu02 = np.sum(weights * dv * dv) / m00
+    mu11 = np.sum(weights * du * dv) / m00
+
+    return u_c, v_c, mu20, mu02, mu11
+
+def inertia_ratio(mu20, mu02, mu11):
+    # Ratio between the minimum and maximum inertia, as in cv2.SimpleBlobDetector
+    denominator = np.sqrt((2 * mu11)**2 + (mu20 - mu02)**2)
+
+    if denominator <= 1e-2:
+        return 1.0
+    
+    i_min = 0.5 * (mu20 + mu02) - 0.5 * denominator
+    i_max = 0.5 * (mu20 + mu02) + 0.5 * denominator
+
+    return i_min / i_max
+
+def contour_filter(blob_mask, params):
+    # Contour based filters, only evaluated if enabled
+    contours, _ = cv2.findContours(blob_mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    contour = max(contours, key=len)
+    contour_area = cv2.contourArea(contour)
+
+    if params.filterByCircularity:
+        perimeter = cv2.arcLength(contour, True)
+        circularity = 4 * np.pi * contour_area / (perimeter * perimeter) if perimeter else 0
+
+        if not params.minCircularity <= circularity < params.maxCircularity:
+            return False
+
+    if params.filterByConvexity:
+        hull_area = cv2.contourArea(cv2.convexHull(contour))
+        convexity = contour_area / hull_area if hull_area else 0
+
+        if not params.minConvexity <= convexity < params.maxConvexity:
+            return False
+        
+    return True
+
+def measure_blob(image, blob_mask, origin, params, contour):
+    pixel_area = np.count_nonzero(blob_mask)
+
+    # Area filter on the contour area (m00) cv2.SimpleBlobDetector measures, not on the pixel count
+    # - Markers are dark in its binarized image, so their contour runs through the centers of the background pixels around them
+    # - That contour encloses the pixel count plus as much as the outer contour through the blob border pixels falls short of it
+    if params.filterByArea and not params.minArea <= 2 * pixel_area - cv2.contourArea(contour) < params.maxArea:
+        return None
+
+    u_c, v_c, mu20, mu02, mu11 = blob_moments(image, blob_mask)
+
+    # Inertia filter
+    if params.filterByInertia and not params.minInertiaRatio <= inertia_ratio(mu20, mu02, mu11) < params.maxInertiaRatio:
+        return None
+
+    # Circularity and convexity filters
+    if (params.filterByCircularity or params.filterByConvexity) and not contour_filter(blob_mask, params):
+        return None
+
+    # Blob centroid in the original image reference and its equivalent diameter
+    # - The diameter is the same measure as the keypoint size of cv2.SimpleBlobDetector
+    return [origin[0] + u_c, 
+            origin[1] + v_c, 
+            2 * np.sqrt(pixel_area / np.pi)]
+
+def label_blob(image, image_thresh, contour, params, origin=(0, 0)):
+    # Sub-image bounding the blob
+    u, v, w, h = cv2.boundingRect(contour)
+
+    # Label the sub-image, neighbouring blobs may be partially inside of it
+    _, labels = cv2.connectedComponents(image_thresh[v:v+h, u:u+w], connectivity=8, ltype=cv2.CV_32S)
+
+    # Contour points belong to the blob
+    u_0, v_0 = contour[0, 0]
+    blob_mask = labels == labels[v_0 - v, u_0 - u]
+
+    return measure_blob(image[v:v+h, u:u+w], blob_mask, (origin[0] + u, origin[1] + v), params, contour)
+
+def locate_blobs(image_thresh):
+    # Outer borders of every 8-connected blob, including blobs inside holes of other blobs
+    contours, hierarchy = cv2.findContours(image_thresh, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+
+    if not contours:
+        return []
+
+    # Outer borders have no parent
+    outer_contours = [contour for contour, (_, _, _, parent) in zip(contours, hierarchy.reshape(-1, 4)) if parent < 0]
+
+    # Border tracing starts at the first pixel of the blob in raster order
+    # - Sorting by it gives the same blob order as a full image connected components labeling
+    outer_contours.sort(key=lambda contour: tuple(contour[0, 0, ::-1]))
+
+    return outer_contours
+
+def find_blobs(image, image_thresh, params=params):
+    # Connected component of each blob, restricted to its bounding box
+    blobs = [label_blob(image, image_thresh, contour, params) for contour in locate_blobs(image_thresh)]
+    blobs = [blob for blob in blobs if blob is not None]
+
+    return np.array(blobs).reshape(-1, 3)
+
+def detect_blobs_connected(image, area=False, params=params, thresh=127):
+    # Markers are brighter than the threshold (the same pixels detect_blobs segments)
+    _, image_thresh = cv2.threshold(image, thresh, 255, cv2.THRESH_BINARY)
+
+    detected_blobs = find_blobs(image, image_thresh, params)
+
+    # No valid blob found!
+    if not detected_blobs.size:
+        return np.array([])
+    
+    # Blob sizes are only returned if needed
+    if not area:
+        return detected_blobs[:, :2]
+
+    return detected_blobs
+
+# Stateful detector that only searches around the predicted blob positions
+class BlobTracker:
+    def __init__(self, 
+                 blob_count=None, # Number of expected blobs, defaults to the number found in the last full scan
+                 radius=16, # Half size of the search window around each predicted blob in pixels
+                 refresh=30, # Frames between forced full image scans
+                 params=params, 
+                 thresh=127
+                 ):
+        
+        # Tracking parameters
+        self.blob_count = blob_count
+        self.radius = radius
+        self.refresh = refresh
+        self.params = params
+        self.thresh = thresh
+
+        # Tracking state
+        self.blobs = None # Last detected blobs as [u, v, size] rows
+        self.velocity = None # Last blob displacement in pixels per frame
+        self.tracked_frames = 0 # Frames since the last full scan
+
+        # Statistics
+        self.full_scans = 0
+        self.tracked_scans = 0
+
+    def reset(self):
+        self.blobs = None
+        self.velocity = None
+        self.tracked_frames = 0
+
+    def full_scan(self, image):
+        _, image_thresh = cv2.threshold(image, self.thresh, 255, cv2.THRESH_BINARY)
+
+        return find_blobs(image, image_thresh, self.params)
+
+    def windowed_scan(self, image):
+        height, width = image.shape[:2]
+
+        # Predicted positions assuming constant velocity
+        predicted_blobs = self.blobs[:, :2] + self.velocity
+
+        # Blobs found in the windows, keyed by their first pixel in raster order (same as a full scan)
+        found_blobs = {}
+
+        for u_p, v_p in predicted_blobs:
+            # Search window clipped to the image
+            u_min, u_max = max(int(u_p) - self.radius, 0), min(int(u_p) + self.radius + 1, width)
+            v_min, v_max = max(int(v_p) - self.radius, 0), min(int(v_p) + self.radius + 1, height)
+
+            # Predicted out of the image
+            if u_min >= u_max or v_min >= v_max:
+                return None
+            
+            sub_image = image[v_min:v_max, u_min:u_max]
+            _, sub_image_thresh = cv2.threshold(sub_image, self.thresh, 255, cv2.THRESH_BINARY)
+
+            for contour in locate_blobs(sub_image_thresh):
+                u, v, w, h = cv2.boundingRect(contour)
+
+                # Blobs cut by the window may extend beyond it, they are only accepted when entirely inside another window
+                if (u == 0 and u_min > 0) or (v == 0 and v_min > 0) or (u + w == u_max - u_min and u_max < width) or (v + h == v_max - v_min and v_max < height):
+                    continue
+
+                first_pixel = (v_min + contour[0, 0, 1], u_min + contour[0, 0, 0])
+
+                if first_pixel not in found_blobs:
+                    found_blobs[first_pixel] = label_blob(sub_image, sub_image_thresh, contour, self.params, (u_min, v_min))
+
+        blobs = [found_blobs[first_pixel] for first_pixel in sorted(found_blobs) if found_blobs[first_pixel] is not None]
+
+        # A blob was lost or split, look for it in the whole image
+        expected_count = self.blob_count if self.blob_count is not None else len(self.blobs)
+
+        if len(blobs) != expected_count:
+            return None
+
+        return np.array(blobs).reshape(-1, 3)
+
+    def update_motion(self, blobs):
+        # Velocity is only estimated when every blob can be matched to the previous frame
+        if self.blobs is None or len(blobs) != len(self.blobs) or not len(blobs):
+            self.velocity = np.zeros((len(blobs), 2))
+
+        else:
+            # Match the new blobs to the predicted ones
+            predicted_blobs = self.blobs[:, :2] + self.velocity
+            distance_matrix = np.linalg.norm(predicted_blobs[:, None, :] - blobs[None, :, :2], axis=2)
+            previous_indices, new_indices = linear_sum_assignment(distance_matrix)
+
+            velocity = np.zeros((len(blobs), 2))
+            velocity[new_indices] = blobs[new_indices, :2] - self.blobs[previous_indices, :2]
+            self.velocity = velocity
+
+        self.blobs = blobs
+
+    def detect(self, image, area=False):
+        blobs = None
+
+        # Search around the predicted blobs until a refresh is due
+        if self.blobs is not None and len(self.blobs) and self.tracked_frames < self.refresh:
+            blobs = self.windowed_scan(image)
+
+        if blobs is None:
+            blobs = self.full_scan(image)
+            self.tracked_frames = 0
+            self.full_scans += 1
+
+        else:
+            self.tracked_frames += 1
+            self.tracked_scans += 1
+
+        self.update_motion(blobs)
+
+        # No valid blob found!
+        if not blobs.size:
+            return np.array([])
+        
+        # Blob sizes are only returned if needed
+        if not area:
+            return blobs[:, :2]
+
+        return blobs
\ No newline at end of file
@@ -5,6 +5,7 @@ import cv2
 from modules.vision.linear_projection import *
 from modules.vision.lens_distortion import *
 from modules.vision.image_noise import *
+from modules.vision.map_cache import default_map_cache
 
 class Camera:
     def __init__(self, 
@@ -19,7 +20,15 @@ class Camera:
                  distortion_coefficients=np.zeros(4), 
  
                  # Image Noise Model
-                 snr_dB=np.inf # No noise
+                 snr_dB=np.inf, # No noise
+                 noise_seed=None, # Seed of the camera's noise stream, for reproducible simulations
+                 noise_bank=0, # Standard normal fields pre-generated for the noise, 0 to draw new samples every frame
+
+                 # Image Remapping
+                 fixed_point_maps=True, # Remap with compact fixed-point maps instead of float maps
+
+                 # Point Undistortion
+                 undistortion_lut=False # Undistort points with a precomputed lookup table instead of the iterative solver
                  ):
 
         # Image Parameters
@@ -28,13 +37,9 @@ class Camera:
         self.image_shape = self.resolution[::-1]
 
         # Pinhole Camera Model
+        # - Derived data is built on first access and discarded when the matrices it depends on change
         self.extrinsic_matrix = extrinsic_matrix
         self.intrinsic_matrix = intrinsic_matrix
-        self.projection_matrix = build_projection_matrix(intrinsic_matrix=self.intrinsic_matrix, 
-                                                         extrinsic_matrix=self.extrinsic_matrix)
-        
-        # Camera Pose
-        self.pose = np.linalg.inv(self.extrinsic_matrix)
 
         # Lens Distortion Model
         self.distortion_model = distortion_model
@@ -52,52 +57,244 @@ class Camera:
             self.undistortion_map = cv2.fisheye.initUndistortRectifyMap
             self.undistortion_function = cv2.fisheye.undistortPoints 
 
-        self.map_u_d, self.map_v_d = None, None
+        # Image remapping parameters
+        self.fixed_point_maps = fixed_point_maps
+
+        # Undistortion lookup table settings, the table itself is built on first use
+        self.undistortion_lut_settings = None
 
-        if self.distortion_model is not None:
-            self.map_u_d, self.map_v_d = build_distortion_map(self.distortion_coefficients, 
-                                                            self.undistortion_map, 
-                                                            self.intrinsic_matrix, 
-                                                            self.resolution)
+        if undistortion_lut:
+            self.enable_undistortion_lut()
  
         # Image Noise Model
         self.snr_dB = snr_dB
         self.snr = np.power(10, (snr_dB / 20)) # Converted for ratio
+        self.noise_engine = NoiseEngine(seed=noise_seed, bank_frames=noise_bank)
+
+    # Serialization Methods
+    def get_parameters(self):
+        # Minimal set of parameters that fully defines the camera model, everything else is derived
+        return {'resolution': tuple(int(pixels) for pixels in self.resolution),
+                'intrinsic_matrix': np.array(self.intrinsic_matrix, dtype=np.float64),
+                'extrinsic_matrix': np.array(self.extrinsic_matrix, dtype=np.float64),
+                'distortion_model': self.distortion_model,
+                'distortion_coefficients': np.array(self.distortion_coefficients, dtype=np.float64),
+                'snr_dB': float(self.snr_dB)}
+    
+    @classmethod
+    def from_parameters(cls, parameters):
+        return cls(resolution=parameters['resolution'],
+                   intrinsic_matrix=parameters['intrinsic_matrix'],
+                   extrinsic_matrix=parameters['extrinsic_matrix'],
+                   distortion_model=parameters['distortion_model'],
+                   distortion_coefficients=parameters['distortion_coefficients'],
+                   snr_dB=parameters['snr_dB'])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        # Derived data is not serialized, it is rebuilt on first access (distortion maps from the map cache)
+        for key in ('_projection_matrix', '_pose', '_distortion_maps', '_remap_maps', '_undistortion_lut'):
+            state[key] = None
+
+        return state
+    
+    def __setstate__(self, state):
+        state = state.copy()
+
+        # Older pickles stored derived data as plain attributes
+        legacy_maps = state.pop('map_u_d', None), state.pop('map_v_d', None)
+        legacy_lut = state.pop('undistortion_lut', None)
+
+        for key in ('projection_matrix', 'pose', 'remap_maps', 'image_buffer'):
+            state.pop(key, None)
+
+        for key in ('intrinsic_matrix', 'extrinsic_matrix'):
+            if key in state:
+                state['_' + key] = state.pop(key)
+
+        # Defaults for attributes missing from older pickles
+        self.clear_intrinsic_cache()
+        self.clear_extrinsic_cache()
+        self.fixed_point_maps = True
+        self.undistortion_lut_settings = None
+        self.noise_engine = NoiseEngine()
+
+        if legacy_lut is not None:
+            self.undistortion_lut_settings = (legacy_lut.step, legacy_lut.tolerance)
+
+        self.__dict__.update(state)
+
+        # Reuse distortion maps carried inline
+        if state.get('_distortion_maps') is None and legacy_maps[0] is not None and legacy_maps[1] is not None:
+            self._distortion_maps = legacy_maps
     
+    # Derived Data Cache Methods
+    def clear_intrinsic_cache(self):
+        self._projection_matrix = None
+        self._distortion_maps = None
+        self._remap_maps = None
+        self._undistortion_lut = None
+
+    def clear_extrinsic_cache(self):
+        self._projection_matrix = None
+        self._pose = None
+
     # Pinhole Camera Model Methods
+    @property
+    def intrinsic_matrix(self):
+        return self._intrinsic_matrix
+    
+    @intrinsic_matrix.setter
+    def intrinsic_matrix(self, intrinsic_matrix):
+        self._intrinsic_matrix = intrinsic_matrix
+        self.clear_intrinsic_cache()
+
+    @property
+    def extrinsic_matrix(self):
+        return self._extrinsic_matrix
+    
+    @extrinsic_matrix.setter
+    def extrinsic_matrix(self, extrinsic_matrix):
+        self._extrinsic_matrix = extrinsic_matrix
+        self.clear_extrinsic_cache()
+
+    @property
+    def projection_matrix(self):
+        if self._projection_matrix is None:
+            self._projection_matrix = build_projection_matrix(intrinsic_matrix=self.intrinsic_matrix, 
+                                                              extrinsic_matrix=self.extrinsic_matrix)
+        
+        return self._projection_matrix
+
+    @property
+    def pose(self):
+        if self._pose is None:
+            self._pose = np.linalg.inv(self.extrinsic_matrix)
+
+        return self._pose
+
     def update_intrinsic(self, new_intrinsic_matrix):
         self.intrinsic_matrix = new_intrinsic_matrix
-        self.projection_matrix = build_projection_matrix(intrinsic_matrix=self.intrinsic_matrix, 
-                                                         extrinsic_matrix=self.extrinsic_matrix)
-        self.map_u_d, self.map_v_d = build_distortion_map(self.distortion_coefficients, 
-                                                          self.undistortion_map, 
-                                                          self.intrinsic_matrix, 
-                                                          self.resolution)
 
     def update_extrinsic(self, new_extrinsic_matrix):
         self.extrinsic_matrix = new_extrinsic_matrix
-        self.pose = np.linalg.inv(self.extrinsic_matrix)
-        self.projection_matrix = build_projection_matrix(intrinsic_matrix=self.intrinsic_matrix, 
-                                                         extrinsic_matrix=self.extrinsic_matrix)
     
     # Distortion Model Methods
-    def undistort_points(self, distorted_points):
+    @property
+    def distortion_maps(self):
+        if self.distortion_model is None:
+            return None
+        
+        # Float distortion maps, reused from the map cache when possible
+        if self._distortion_maps is None:
+            self._distortion_maps = build_distortion_map(self.distortion_coefficients, 
+                                                         self.undistortion_map, 
+                                                         self.intrinsic_matrix, 
+                                                         self.resolution,
+                                                         cache=default_map_cache)
+            
+        return self._distortion_maps
+
+    @property
+    def map_u_d(self):
+        return None if self.distortion_maps is None else self.distortion_maps[0]
+    
+    @property
+    def map_v_d(self):
+        return None if self.distortion_maps is None else self.distortion_maps[1]
+
+    @property
+    def remap_maps(self):
+        # Maps in the format passed to cv2.remap
+        if self._remap_maps is None and self.distortion_maps is not None:
+            map_u_d, map_v_d = self.distortion_maps
+
+            if self.fixed_point_maps:
+                # Packed integer coordinates, rounded for nearest neighbor interpolation (half the memory of the float maps)
+                self._remap_maps = cv2.convertMaps(map1=map_u_d, 
+                                                   map2=map_v_d, 
+                                                   dstmap1type=cv2.CV_16SC2, 
+                                                   nninterpolation=True)
+                
+                # Float maps are not kept next to the packed ones, they are rebuilt (from the map cache) if needed again
+                self._distortion_maps = None
+
+            else:
+                self._remap_maps = (map_u_d, map_v_d)
+
+        return self._remap_maps
+
+    def set_fixed_point_maps(self, fixed_point_maps):
+        self.fixed_point_maps = fixed_point_maps
+        self._remap_maps = None
+
+    def solve_undistortion(self, distorted_points):
         return self.undistortion_function(distorted_points.reshape(1, -1, 2).astype(np.float32), 
                                           self.intrinsic_matrix, 
                                           self.distortion_coefficients,
                                           np.array([]),
                                           self.intrinsic_matrix).reshape(-1,2)
+
+    def enable_undistortion_lut(self, step=8, tolerance=0.01):
+        # Grid step is refined until the interpolation error against the solver is within tolerance (in pixels)
+        self.undistortion_lut_settings = (step, tolerance)
+        self._undistortion_lut = None
+
+    def disable_undistortion_lut(self):
+        self.undistortion_lut_settings = None
+        self._undistortion_lut = None
+
+    @property
+    def undistortion_lut(self):
+        if self._undistortion_lut is None and self.undistortion_lut_settings is not None:
+            step, tolerance = self.undistortion_lut_settings
+
+            self._undistortion_lut = UndistortionLUT(undistort_function=self.solve_undistortion, 
+                                                     resolution=self.resolution, 
+                                                     step=step, 
+                                                     tolerance=tolerance)
+            
+        return self._undistortion_lut
+    
+    def undistort_points(self, distorted_points):
+        lut = self.undistortion_lut
+
+        if lut is None:
+            return self.solve_undistortion(distorted_points)
+        
+        distorted_points = np.asarray(distorted_points, dtype=np.float64).reshape(-1, 2)
+
+        # Points outside the table fall back to the solver
+        inside = lut.contains(distorted_points)
+
+        if inside.all():
+            return lut.interpolate(distorted_points).astype(np.float32)
+        
+        undistorted_points = np.empty(distorted_points.shape, dtype=np.float32)
+        undistorted_points[inside] = lut.interpolate(distorted_points[inside])
+        undistorted_points[~inside] = self.solve_undistortion(distorted_points[~inside])
+
+        return undistorted_points
     
-    def distort_image(self, image_pinhole):
-        if self.map_u_d is None or self.map_v_d is None:
+    def distort_image(self, image_pinhole, out=None):
+        # The distorted image is written to out if given (e.g. a buffer reused between frames), to a new image otherwise
+        remap_maps = self.remap_maps
+
+        if remap_maps is None:
             return image_pinhole
+
+        map_1, map_2 = remap_maps
         
         return cv2.remap(image_pinhole,
-                         map1=self.map_u_d, 
-                         map2=self.map_v_d, 
-                         interpolation=cv2.INTER_NEAREST) 
+                         map1=map_1, 
+                         map2=map_2, 
+                         interpolation=cv2.INTER_NEAREST,
+                         dst=out) 
     
     # Noise Model Methods
-    def noise_image(self, image_noiseless):
-        return add_noise(image_noiseless=image_noiseless, 
-                         snr=self.snr)
+    def noise_image(self, image_noiseless, out=None):
+        # The noisy image is written to out if given, to a new image otherwise
+        return self.noise_engine.add_noise(image_noiseless=image_noiseless, 
+                                           snr=self.snr,
+                                           out=out)
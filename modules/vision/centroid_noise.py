@@ -0,0 +1,84 @@
+# Importing modules...
+from scipy.interpolate import RegularGridInterpolator
+import numpy as np
+import cv2
+
+from modules.vision.image_noise import NoiseEngine
+from modules.vision.blob_detection import detect_blobs
+
+# Blob centroid noise of the image pipeline, measured over a grid of SNRs and blob diameters
+# - Stands in for rendering, noising and detecting markers when only the centroids are needed
+class CentroidNoiseModel:
+    def __init__(self,
+                 backend='simple', # Blob detection backend being modeled (see detect_blobs)
+                 snr_dB_grid=(6, 10, 13, 20, 30, 40), # Noise levels in dB, higher finite SNRs are treated as the last one
+                 diameter_grid=(3, 6, 12, 24, 48), # Blob diameters in pixels, clipped to the grid limits
+                 frames=100, # Rendered markers per grid node
+                 seed=0
+                 ):
+
+        self.backend = backend
+        self.snr_dB_grid = np.asarray(snr_dB_grid, dtype=np.float64)
+        self.diameter_grid = np.asarray(diameter_grid, dtype=np.float64)
+        self.frames = frames
+        self.seed = seed
+
+        self.calibrate()
+
+    def calibrate(self):
+        rng = np.random.default_rng(self.seed)
+
+        # Centroid standard deviation per image axis and detection rate of each grid node
+        sigma_table = np.zeros((self.snr_dB_grid.size, self.diameter_grid.size))
+        detection_table = np.zeros((self.snr_dB_grid.size, self.diameter_grid.size))
+
+        for j, diameter in enumerate(self.diameter_grid):
+            # Single marker image with room for the noisy blob
+            size = int(np.ceil(2 * diameter)) + 16
+
+            # Same image model as the simulated cameras: anti-aliased marker at full intensity
+            images, centers = [], rng.uniform(size / 2 - 1, size / 2 + 1, size=(self.frames, 2))
+
+            for center in centers:
+                image = np.zeros((size, size), dtype=np.uint8)
+                cv2.circle(image, tuple(np.round(center * 256).astype(int)), int(round(diameter / 2 * 256)), 255, -1, cv2.LINE_AA, shift=8)
+                images.append(image)
+
+            for i, snr_dB in enumerate(self.snr_dB_grid):
+                noise_engine = NoiseEngine(seed=rng.integers(2**32))
+                image_noisy = np.empty((size, size), dtype=np.uint8) # Detected right away, so reused between frames
+                errors = []
+
+                for image, center in zip(images, centers):
+                    detected_blobs = detect_blobs(noise_engine.add_noise(image, np.power(10, snr_dB / 20), out=image_noisy), backend=self.backend)
+
+                    # Marker lost or split
+                    if len(detected_blobs) != 1:
+                        continue
+
+                    errors.append(detected_blobs[0, :2] - center)
+
+                detection_table[i, j] = len(errors) / self.frames
+                sigma_table[i, j] = np.mean(np.std(errors, axis=0)) if len(errors) > 1 else 0.0
+
+        # Linear interpolation between grid nodes
+        grid = (self.snr_dB_grid, self.diameter_grid)
+
+        self.sigma_table, self.detection_table = sigma_table, detection_table
+        self.sigma_interpolator = RegularGridInterpolator(grid, sigma_table)
+        self.detection_interpolator = RegularGridInterpolator(grid, detection_table)
+
+    def query_points(self, snr_dB, diameters):
+        # Grid queries shaped as the diameters, with values outside the grid clipped to its limits
+        snr_dB = np.clip(np.broadcast_to(snr_dB, np.shape(diameters)), self.snr_dB_grid[0], self.snr_dB_grid[-1])
+        diameters = np.clip(diameters, self.diameter_grid[0], self.diameter_grid[-1])
+
+        return np.stack((snr_dB, diameters), axis=-1)
+
+    def sigma(self, snr_dB, diameters):
+        # Centroid standard deviation per image axis in pixels, none without noise (infinite SNR)
+        return np.where(np.isposinf(snr_dB), 0.0, self.sigma_interpolator(self.query_points(snr_dB, diameters)))
+
+    def detection_rate(self, snr_dB, diameters):
+        # Probability of a marker being detected as a single blob, always without noise (infinite SNR)
+        return np.where(np.isposinf(snr_dB), 1.0, self.detection_interpolator(self.query_points(snr_dB, diameters)))
@@ -4,9 +4,74 @@ import numpy as np
 def add_noise(image_noiseless, snr):
     if snr == np.inf:
         return image_noiseless
-    
+
     image_noisy = np.random.normal(image_noiseless.astype(np.float32), image_noiseless / snr)
 
-    image_noisy = np.clip(0, 255, image_noisy).astype(np.uint8)
+    image_noisy = np.clip(image_noisy, 0, 255).astype(np.uint8)
 
     return image_noisy
+
+# Signal dependent gaussian noise with a seeded random stream and reused buffers
+class NoiseEngine:
+    def __init__(self,
+                 seed=None, # Seed of the random stream, None for a non-reproducible stream
+                 bank_frames=0 # Standard normal fields kept in a bank, 0 to draw new samples every frame
+                 ):
+
+        self.seed = seed
+        self.bank_frames = bank_frames
+
+        self.generator = np.random.default_rng(seed)
+
+        # Work buffers, allocated for the first image and reused while its shape is kept
+        self.noise_buffer = None # float32 noisy image
+        self.bank = None # Flat bank of standard normal samples
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        # Buffers are rebuilt on first use
+        state['noise_buffer'] = None
+        state['bank'] = None
+
+        return state
+
+    def allocate(self, image_shape):
+        self.noise_buffer = np.empty(image_shape, dtype=np.float32)
+
+        if self.bank_frames:
+            # One frame longer than the bank so every window start in it is valid
+            self.bank = self.generator.standard_normal((self.bank_frames + 1) * self.noise_buffer.size, dtype=np.float32)
+
+    def standard_normal(self):
+        # Fresh samples written straight into the work buffer
+        if self.bank is None:
+            return self.generator.standard_normal(out=self.noise_buffer, dtype=np.float32)
+
+        # Window of the bank starting at a random sample, so consecutive frames do not repeat the same field
+        start = self.generator.integers(0, self.bank.size - self.noise_buffer.size + 1)
+
+        return self.bank[start:start + self.noise_buffer.size].reshape(self.noise_buffer.shape)
+
+    def add_noise(self, image_noiseless, snr, out=None):
+        # The uint8 noisy image is written to out if given (e.g. a buffer reused between frames), to a new image otherwise
+        if snr == np.inf:
+            return image_noiseless
+
+        if self.noise_buffer is None or self.noise_buffer.shape != image_noiseless.shape:
+            self.allocate(image_noiseless.shape)
+
+        # Same model as add_noise: gaussian noise with standard deviation proportional to the pixel value
+        # - image * (1 + z / snr), computed in place on the float32 work buffer
+        noise = np.multiply(self.standard_normal(), np.float32(1 / snr), out=self.noise_buffer)
+        noise += np.float32(1)
+        noise *= image_noiseless
+
+        np.clip(noise, 0, 255, out=noise)
+
+        if out is None:
+            out = np.empty(noise.shape, dtype=np.uint8)
+
+        np.copyto(out, noise, casting='unsafe') # Truncated, as astype(np.uint8)
+
+        return out
@@ -1,90 +1,112 @@
 # Importing modules...
-from scipy.interpolate import griddata
+from scipy.ndimage import distance_transform_edt
 import numpy as np
 import cv2
 
-def distort_rational(image_point, intrinsic_matrix, rational_coefficients):
+def distort_rational_points(image_points, intrinsic_matrix, rational_coefficients):
+    # Points shaped (..., N, 2), e.g. (N, 2) for a set of points or (frames, N, 2) for a trajectory
+    image_points = np.asarray(image_points, dtype=np.float64)
+
     # Get intrinsic parameters
     f_x, f_y = intrinsic_matrix[0][0], intrinsic_matrix[1][1]
     c_x, c_y = intrinsic_matrix[0][2], intrinsic_matrix[1][2]
 
-    [[u], [v]] = image_point
+    u, v = image_points[..., 0], image_points[..., 1]
 
     # Normalize coordinates
-    x, y = (u - c_x)/f_x, (v - c_y)/f_y 
-
-    normalized_image_point = np.array([[x],
-                                       [y]])
+    x, y = (u - c_x)/f_x, (v - c_y)/f_y
 
     # Radial distance
-    r = np.linalg.norm(normalized_image_point)
+    r = np.sqrt(x*x + y*y)
 
-    # Get distortion coefficients (OpenCV's style)
-    k1, k2, p1, p2, k3, k4, k5, k6 = rational_coefficients
-    
-    # Get radial and tangential transformation vectors
-    radial_transformation = normalized_image_point * (1 + k1*r**2 + k2*r**4 + k3*r**6)/(1 + k4*r**2 + k5*r**4 + k6*r**6)
+    # Get distortion coefficients (OpenCV's style), omitted higher order coefficients are zero
+    padded_coefficients = np.zeros(8)
+    padded_coefficients[:len(rational_coefficients)] = rational_coefficients
+    k1, k2, p1, p2, k3, k4, k5, k6 = padded_coefficients
 
-    tangential_transformation = np.array([[2*p1*x*y + p2*(r**2 + 2*x**2)],
-                                          [p1*(r**2 + 2*y**2) + 2*p2*x*y]])
-    
-    # Get distorted normalized point
-    [[x_d], [y_d]] = radial_transformation + tangential_transformation
+    # Get radial and tangential transformations
+    radial_numerator = 1 + k1*r**2 + k2*r**4 + k3*r**6
+    radial_denominator = 1 + k4*r**2 + k5*r**4 + k6*r**6
 
-    # Re-scale and re-center point
-    u_d, v_d = x_d * f_x + c_x, y_d * f_y + c_y
+    x_d = x * radial_numerator / radial_denominator + (2*p1*x*y + p2*(r**2 + 2*x**2))
+    y_d = y * radial_numerator / radial_denominator + (p1*(r**2 + 2*y**2) + 2*p2*x*y)
 
-    return np.array([[u_d],
-                     [v_d]])
+    # Re-scale and re-center points
+    return np.stack((x_d * f_x + c_x, y_d * f_y + c_y), axis=-1)
+
+def distort_fisheye_points(image_points, intrinsic_matrix, fisheye_coefficients):
+    # Points shaped (..., N, 2), e.g. (N, 2) for a set of points or (frames, N, 2) for a trajectory
+    image_points = np.asarray(image_points, dtype=np.float64)
 
-def distort_fisheye(image_point, intrinsic_matrix, fisheye_coefficients):
     # Get intrinsic parameters
     f_x, f_y = intrinsic_matrix[0][0], intrinsic_matrix[1][1]
     c_x, c_y = intrinsic_matrix[0][2], intrinsic_matrix[1][2]
 
-    [[u], [v]] = image_point
+    u, v = image_points[..., 0], image_points[..., 1]
 
     # Normalize coordinates
-    x, y = (u - c_x)/f_x, (v - c_y)/f_y 
-
-    normalized_image_point = np.array([[x],
-                                       [y]])
+    x, y = (u - c_x)/f_x, (v - c_y)/f_y
 
     # Distortion parameters
-    r = np.linalg.norm(normalized_image_point)
+    r = np.sqrt(x*x + y*y)
     theta = np.arctan(r)
 
     # Get distortion coefficients (OpenCV's style)
     k1, k2, k3, k4 = fisheye_coefficients
 
-    if r != 0:
-        [[x_d], [y_d]] = normalized_image_point * (theta + k1*theta**3 + k2*theta**5 + k3*theta**7 + k4*theta**9)/r
-    else:
-        [[x_d], [y_d]] = normalized_image_point # Do not distort
+    theta_d = theta + k1*theta**3 + k2*theta**5 + k3*theta**7 + k4*theta**9
 
-    # Re-scale and re-center point
-    u_d, v_d = x_d * f_x + c_x, y_d * f_y + c_y
+    # Do not distort points at the principal point
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_d = np.where(r != 0, x * theta_d / r, x)
+        y_d = np.where(r != 0, y * theta_d / r, y)
 
-    return np.array([[u_d],
-                     [v_d]])
+    # Re-scale and re-center points
+    return np.stack((x_d * f_x + c_x, y_d * f_y + c_y), axis=-1)
 
-def interpolate_map(map):
-    missing_indices = np.array(np.where(np.isnan(map))).T
+def distort_rational(image_point, intrinsic_matrix, rational_coefficients):
+    # Single 2x1 point version of distort_rational_points
+    distorted_point = distort_rational_points(np.reshape(image_point, (1, 2)), intrinsic_matrix, rational_coefficients)
+
+    return distorted_point.reshape(2, 1)
+
+def distort_fisheye(image_point, intrinsic_matrix, fisheye_coefficients):
+    # Single 2x1 point version of distort_fisheye_points
+    distorted_point = distort_fisheye_points(np.reshape(image_point, (1, 2)), intrinsic_matrix, fisheye_coefficients)
 
-    # Create a grid of indices for the known values
-    known_indices = np.array(np.where(~np.isnan(map))).T
-    known_values = map[~np.isnan(map)]
+    return distorted_point.reshape(2, 1)
 
-    # Use interpolation to estimate missing values
-    estimated_values = griddata(known_indices, known_values, missing_indices, method='nearest')
+def distort_points(image_points, intrinsic_matrix, distortion_model, distortion_coefficients):
+    if distortion_model == 'rational':
+        return distort_rational_points(image_points, intrinsic_matrix, distortion_coefficients)
 
-    # Replace missing values with the estimated values
-    estimated_map = map.copy()
-    estimated_map[np.isnan(map)] = estimated_values
+    if distortion_model == 'fisheye':
+        return distort_fisheye_points(image_points, intrinsic_matrix, distortion_coefficients)
+
+    return np.asarray(image_points, dtype=np.float64) # No distortion is applied
+
+def nearest_known_indices(missing):
+    # Index of the nearest known pixel for every pixel, using an exact Euclidean distance transform
+    # - Linear in the number of pixels, no triangulation or tree over the known pixels is built
+    nearest_indices = distance_transform_edt(missing, return_distances=False, return_indices=True)
+
+    return tuple(nearest_indices)
+
+def interpolate_map(map):
+    # Replace missing values with their nearest known values
+    estimated_map = map[nearest_known_indices(np.isnan(map))]
 
     return estimated_map
 
-def build_distortion_map(distortion_coefficients, undistortion_map, intrinsic_matrix, resolution):
+def build_distortion_map(distortion_coefficients, undistortion_map, intrinsic_matrix, resolution, cache=None):
+    # Reuse maps built with the same parameters
+    if cache is not None:
+        key = cache.key(undistortion_map, distortion_coefficients, intrinsic_matrix, resolution)
+        cached_maps = cache.load(key)
+
+        if cached_maps is not None:
+            return cached_maps
+
     image_shape = resolution[::-1]
 
     # Make undistortion maps
@@ -95,27 +117,137 @@ def build_distortion_map(distortion_coefficients, undistortion_map, intrinsic_ma
                                     resolution,
                                     cv2.CV_32FC1)
 
-    # Round maps and cast to integer for exact indexing 
-    map_u = np.round(map_u).astype(int) 
-    map_v = np.round(map_v).astype(int) 
+    # Round maps for exact indexing 
+    map_u = np.round(map_u) 
+    map_v = np.round(map_v) 
+
+    # Pinhole pixel coordinates of every map entry
+    v, u = np.indices(image_shape)
+
+    # Do not remap points outside the image limits (comparisons with NaN are also discarded)
+    inside = (map_u >= 0) & (map_u < image_shape[1]) & (map_v >= 0) & (map_v < image_shape[0])
+
+    u, v = u[inside], v[inside]
+    u_d, v_d = map_u[inside].astype(int), map_v[inside].astype(int)
+
+    # Flat indices of the distorted pixels, in the same row-major order as the pinhole pixels
+    flat_d = v_d * image_shape[1] + u_d
+
+    # Several pinhole pixels may land on the same distorted pixel: keep the last one in row-major order
+    _, last = np.unique(flat_d[::-1], return_index=True)
+    last = flat_d.size - 1 - last
 
     # Invert undistortion maps
     map_u_d = np.full(image_shape, np.nan, dtype=np.float32)
     map_v_d = np.full(image_shape, np.nan, dtype=np.float32)
 
-    for v in range(image_shape[0]):
-        for u in range(image_shape[1]):
+    map_u_d.flat[flat_d[last]] = u[last]
+    map_v_d.flat[flat_d[last]] = v[last]
+    
+    # Interpolate maps (both maps share the same missing pixels)
+    missing = np.isnan(map_u_d)
 
-            u_d = map_u[v][u] 
-            v_d = map_v[v][u]
+    if missing.any():
+        nearest_indices = nearest_known_indices(missing)
 
-            # Do not remap points outside the image limits
-            if (u_d >= 0 and u_d < image_shape[1]) and (v_d >= 0 and v_d < image_shape[0]):
-                map_u_d[v_d][u_d] = u
-                map_v_d[v_d][u_d] = v
-    
-    # Interpolate maps
-    map_u_d = interpolate_map(map_u_d).astype(np.float32)
-    map_v_d = interpolate_map(map_v_d).astype(np.float32)
+        map_u_d = map_u_d[nearest_indices]
+        map_v_d = map_v_d[nearest_indices]
+
+    if cache is not None:
+        cache.store(key, map_u_d, map_v_d)
+
+    return map_u_d, map_v_d
+
+# Dense undistortion lookup table with bilinear interpolation
+class UndistortionLUT:
+    def __init__(self, 
+                 undistort_function, # Reference undistortion, maps (N, 2) distorted points to (N, 2) undistorted points
+                 resolution, 
+                 step=8, # Initial grid spacing in pixels
+                 tolerance=0.01 # Maximum interpolation error allowed in pixels, checked at sampled points (see build)
+                 ):
+        
+        self.resolution = resolution
+        self.tolerance = tolerance
+
+        # Refine the grid until the interpolation error is within tolerance
+        while True:
+            self.build(undistort_function, step)
+
+            if self.max_error <= tolerance or step == 1:
+                break
+
+            step = max(1, step // 2)
+
+    def build(self, undistort_function, step):
+        self.step = step
+
+        # Grid nodes covering every pixel of the distorted image
+        self.grid_u = np.arange(0, max(self.resolution[0] - 1, 1) + step, step, dtype=np.float64)
+        self.grid_v = np.arange(0, max(self.resolution[1] - 1, 1) + step, step, dtype=np.float64)
+        nodes = np.stack(np.meshgrid(self.grid_u, self.grid_v), axis=-1)
+
+        # Undistorted node coordinates, shaped (grid_v, grid_u, 2)
+        table = undistort_function(nodes.reshape(-1, 2)).reshape(nodes.shape).astype(np.float64)
+
+        # Bilinear polynomial coefficients of each cell, flattened per image axis
+        # - f(w_u, w_v) = a + b*w_u + c*w_v + d*w_u*w_v, with (w_u, w_v) the position inside the cell
+        f_00, f_01 = table[:-1, :-1], table[:-1, 1:]
+        f_10, f_11 = table[1:, :-1], table[1:, 1:]
+
+        self.coefficients = [[np.ascontiguousarray(coefficient[..., axis]).ravel() for coefficient in (f_00, 
+                                                                                                        f_01 - f_00, 
+                                                                                                        f_10 - f_00, 
+                                                                                                        f_11 - f_10 - f_01 + f_00)]
+                             for axis in range(2)]
+
+        # Bilinear interpolation error is largest between nodes: check cell centers and edge midpoints
+        half = step / 2
+        test_u = np.concatenate((self.grid_u, self.grid_u[:-1] + half))
+        test_v = np.concatenate((self.grid_v, self.grid_v[:-1] + half))
+        test_points = np.stack(np.meshgrid(test_u, test_v), axis=-1).reshape(-1, 2)
+
+        # Only points inside the image are ever looked up
+        inside = (test_points[:, 0] <= self.resolution[0] - 1) & (test_points[:, 1] <= self.resolution[1] - 1)
+        test_points = test_points[inside]
+
+        reference_points = undistort_function(test_points)
+        errors = np.linalg.norm(self.interpolate(test_points) - reference_points, axis=1)
+
+        # Sampled estimate of the interpolation error, not a bound: errors between the sampled points are not checked
+        # - Points where the interpolation fails but the reference solver does not are infinite errors
+        # - Points the reference solver fails on cannot be checked and are counted apart
+        self.failed_points = int(np.count_nonzero(np.isnan(reference_points).any(axis=1)))
+
+        errors[np.isnan(errors) & ~np.isnan(reference_points).any(axis=1)] = np.inf
+        errors = errors[~np.isnan(errors)]
+
+        self.max_error = float(errors.max()) if errors.size else 0.0
+
+    def contains(self, distorted_points):
+        u, v = distorted_points[:, 0], distorted_points[:, 1]
+
+        return (u >= 0) & (u <= self.grid_u[-1]) & (v >= 0) & (v <= self.grid_v[-1])
+
+    def interpolate(self, distorted_points):
+        # Continuous grid coordinates
+        g_u = distorted_points[:, 0] * (1 / self.step)
+        g_v = distorted_points[:, 1] * (1 / self.step)
+
+        # Cell containing each point, points on the last grid line belong to the last cell
+        i_u = np.minimum(g_u.astype(np.intp), self.grid_u.size - 2)
+        i_v = np.minimum(g_v.astype(np.intp), self.grid_v.size - 2)
+
+        cell = i_v * (self.grid_u.size - 1) + i_u
+
+        # Position inside the cell
+        w_u = g_u - i_u
+        w_v = g_v - i_v
+
+        # Evaluate the bilinear polynomial of each cell, one image axis at a time
+        undistorted_points = np.empty((distorted_points.shape[0], 2))
+
+        for axis, (a, b, c, d) in enumerate(self.coefficients):
+            undistorted_points[:, axis] = a.take(cell) + b.take(cell) * w_u + (c.take(cell) + d.take(cell) * w_u) * w_v
 
-    return map_u_d, map_v_d
\ No newline at end of file
+        return undistorted_points
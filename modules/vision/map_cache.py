@@ -0,0 +1,163 @@
+# Importing modules...
+import os
+import time
+import hashlib
+import tempfile
+import numpy as np
+import cv2
+
+# Names for the undistortion map builders, used to tell distortion models apart in the cache keys
+undistortion_map_names = {
+    cv2.initUndistortRectifyMap: 'rational',
+    cv2.fisheye.initUndistortRectifyMap: 'fisheye'
+}
+
+# Content-addressed on-disk cache for distortion maps
+class DistortionMapCache:
+    def __init__(self,
+                 directory=None, # Cache directory, defaults to $VIRTUALMOCAP_CACHE or ~/.cache/virtualmocap
+                 max_bytes=2**30, # Maximum cache size in bytes before evicting the least recently used maps
+                 stale_seconds=3600 # Age of leftover temporary files (e.g. from an interrupted write) removed when evicting
+                 ):
+
+        if directory is None:
+            directory = os.environ.get('VIRTUALMOCAP_CACHE',
+                                       os.path.join(os.path.expanduser('~'), '.cache', 'virtualmocap'))
+
+        self.directory = os.path.join(directory, 'distortion_maps')
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+
+    def key(self, undistortion_map, distortion_coefficients, intrinsic_matrix, resolution):
+        # Distortion model name, falling back to the builder name for unknown models
+        model = undistortion_map_names.get(undistortion_map, getattr(undistortion_map, '__name__', repr(undistortion_map)))
+
+        # Hash every parameter that changes the maps
+        digest = hashlib.sha256()
+        digest.update(b'v1') # Map format version
+        digest.update(model.encode())
+        digest.update(np.ravel(np.asarray(distortion_coefficients, dtype=np.float64)).tobytes())
+        digest.update(np.asarray(intrinsic_matrix, dtype=np.float64).tobytes())
+        digest.update(np.asarray(resolution, dtype=np.int64).tobytes())
+
+        return digest.hexdigest()
+
+    def paths(self, key):
+        return (os.path.join(self.directory, f'{key}_u.npy'),
+                os.path.join(self.directory, f'{key}_v.npy'))
+
+    def load(self, key):
+        path_u, path_v = self.paths(key)
+
+        try:
+            # Memory-mapped and read-only, so the pages are shared between processes
+            # - The u map marks a complete entry, it is written after the v map and evicted before it
+            map_u_d = np.load(path_u, mmap_mode='r')
+            map_v_d = np.load(path_v, mmap_mode='r')
+
+        except (OSError, ValueError): # Missing, partially evicted or unreadable entry
+            return None
+
+        try:
+            # Mark entry as recently used
+            os.utime(path_u)
+            os.utime(path_v)
+
+        except OSError: # Read-only or shared cache, the entry is still a hit
+            pass
+
+        return map_u_d, map_v_d
+
+    def store(self, key, map_u_d, map_v_d):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            # Write each map to a temporary file and move it into place, so readers never see partial files
+            # - The u map is written last, once the v map is in place
+            for path, map in zip(self.paths(key)[::-1], (map_v_d, map_u_d)):
+                file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+
+                try:
+                    with os.fdopen(file_descriptor, 'wb') as file:
+                        np.save(file, map)
+
+                    os.replace(temporary_path, path)
+
+                except OSError: # e.g. disk full, the temporary file is not left behind
+                    os.remove(temporary_path)
+                    raise
+
+            self.evict()
+
+        except OSError: # Caching is an optimization, never fail because of it
+            pass
+
+    def evict(self):
+        # Gather cache entries by key, with their last use and size
+        entries = {}
+        now = time.time()
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+
+            try:
+                status = os.stat(path)
+
+            except OSError: # Removed by another process
+                continue
+
+            # Temporary files of writes that never finished, recent ones may still be being written
+            if name.endswith('.tmp'):
+                if now - status.st_mtime > self.stale_seconds:
+                    try:
+                        os.remove(path)
+
+                    except OSError:
+                        pass
+
+                continue
+
+            if not name.endswith(('_u.npy', '_v.npy')):
+                continue
+
+            # Last use is the one of the u map, entries without it are incomplete and go first
+            entry = entries.setdefault(name[:-len('_u.npy')], [-np.inf, 0, status.st_mtime])
+            entry[1] += status.st_size
+
+            if name.endswith('_u.npy'):
+                entry[0] = status.st_mtime
+
+        total_bytes = sum(size for _, size, _ in entries.values())
+
+        # Remove the least recently used entries until the cache fits, both maps at once
+        for (last_use, size, modified), key in sorted((entry, key) for key, entry in entries.items()):
+            if total_bytes <= self.max_bytes:
+                break
+
+            # Recent incomplete entries may still be being written by another process
+            if last_use == -np.inf and now - modified <= self.stale_seconds:
+                continue
+
+            # The u map goes first, so the entry stops being complete before the v map is removed
+            for path in self.paths(key):
+                try:
+                    os.remove(path) # Processes that already mapped the file keep their pages
+
+                except OSError: # Removed by another process, or missing from an incomplete entry
+                    continue
+
+            total_bytes -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+
+            except OSError:
+                continue
+
+# Cache shared by all camera models
+default_map_cache = DistortionMapCache()
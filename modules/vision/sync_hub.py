@@ -0,0 +1,140 @@
+# Importing modules...
+import asyncio
+import time
+import numpy as np
+
+# Synchronized PTS of every camera, released to reconstruction as soon as they are complete
+# - Each synchronized PTS keeps a bitmask of the cameras that interpolated it, updated from the progress of their synchronizers
+# - Synchronized PTS are released in order, when every camera has them or when their deadline expires
+class SyncHub:
+    def __init__(self,
+                 synchronizers, # Synchronizer of each camera, all with the same synchronized PTS
+                 deadline=None, # Seconds a synchronized PTS waits for the missing cameras after the first one has it (forever if None)
+                 min_cameras=2, # Cameras needed to release a synchronized PTS, otherwise it is skipped
+                 predictions=False # Release predicted blobs too (see the Synchronizer prediction)
+                 ):
+
+        if len(synchronizers) > 64:
+            raise ValueError(f'SyncHub supports up to 64 cameras, got {len(synchronizers)}')
+
+        if len({synchronizer.sync_PTS.size for synchronizer in synchronizers}) > 1:
+            raise ValueError('Synchronizers must have the same synchronized PTS')
+
+        self.synchronizers = list(synchronizers)
+        self.deadline = deadline
+        self.min_cameras = min_cameras
+        self.predictions = predictions
+
+        n_cameras = len(self.synchronizers)
+        n_sync = self.synchronizers[0].sync_PTS.size if n_cameras else 0
+
+        self.bits = [np.uint64(1 << camera) for camera in range(n_cameras)]
+        self.complete = np.uint64((1 << n_cameras) - 1)
+
+        self.available = np.zeros(n_sync, dtype=np.uint64) # Cameras with each synchronized PTS
+        self.first_arrival = np.full(n_sync, np.inf) # Time the first camera had each synchronized PTS
+        self.progress = np.zeros(n_cameras, dtype=np.int64) # Synchronized PTS marked so far for each camera
+
+        self.next = 0 # Next synchronized PTS to release
+        self.closed = False
+        self.updated = asyncio.Event()
+
+        self.statistics = {'complete': 0, 'expired': 0, 'skipped': 0}
+
+    def add_data(self, camera, blobs, PTS):
+        # Synchronize a message of a camera, returns whether its synchronizer accepted it
+        accepted = self.synchronizers[camera].add_data(blobs, PTS)
+
+        if accepted:
+            self.update(camera)
+
+        return accepted
+
+    def update(self, camera):
+        # Mark the synchronized PTS a camera interpolated since the last update (e.g. after feeding its synchronizer elsewhere)
+        synchronizer = self.synchronizers[camera]
+        end = synchronizer.interpolation_start
+
+        if self.predictions:
+            end += np.count_nonzero(synchronizer.sync_predicted[end:end + synchronizer.prediction])
+
+        start = self.progress[camera]
+
+        if end <= start:
+            return
+
+        self.available[start:end] |= self.bits[camera]
+        np.minimum(self.first_arrival[start:end], time.monotonic(), out=self.first_arrival[start:end])
+
+        self.progress[camera] = end
+        self.updated.set()
+
+    @property
+    def completed(self):
+        # Synchronized PTS every camera has, from the start
+        return int(self.progress.min()) if self.progress.size else 0
+
+    def expiry(self):
+        # Seconds until the deadline of the next synchronized PTS, None if there is nothing to wait for
+        if self.deadline is None or self.next >= self.available.size or not self.available[self.next]:
+            return None
+
+        return max(self.first_arrival[self.next] + self.deadline - time.monotonic(), 0)
+
+    def frames(self, flush=False):
+        # Release the synchronized PTS that are ready, in order, as (T, {camera: blobs}) without waiting
+        # - Flush releases the remaining ones regardless of their deadline, e.g. once the capture is over
+        while self.next < self.available.size:
+            T = self.next
+            available = self.available[T]
+
+            if available != self.complete:
+                # Cameras interpolate their synchronized PTS in order, no later one has data either
+                if not available:
+                    break
+
+                if not flush and (self.deadline is None or time.monotonic() < self.first_arrival[T] + self.deadline):
+                    break
+
+            self.next += 1
+
+            cameras = [camera for camera, bit in enumerate(self.bits) if available & bit]
+
+            if len(cameras) < self.min_cameras:
+                self.statistics['skipped'] += 1
+                continue
+
+            self.statistics['complete' if available == self.complete else 'expired'] += 1
+
+            yield T, {camera: self.synchronizers[camera].sync_blobs[T].copy() for camera in cameras}
+
+    def close(self):
+        # No more messages, the stream flushes the remaining synchronized PTS and ends
+        self.closed = True
+        self.updated.set()
+
+    def __iter__(self):
+        return self.frames()
+
+    def __aiter__(self):
+        return self.stream()
+
+    async def stream(self):
+        # Release synchronized PTS as they become ready, waking on updates and deadlines, until closed
+        while True:
+            for frame in self.frames():
+                yield frame
+
+            if self.closed:
+                for frame in self.frames(flush=True):
+                    yield frame
+
+                return
+
+            self.updated.clear()
+
+            try:
+                await asyncio.wait_for(self.updated.wait(), self.expiry())
+
+            except asyncio.TimeoutError:
+                continue
@@ -12,29 +12,162 @@ def proximity_order(previous_blobs, current_blobs):
 
     return current_blobs[new_indices]
 
+# Interpolation of the blob trajectories
+interpolation_methods = ('scipy',       # CubicSpline per blob
+                         'closed_form') # Same not-a-knot spline for every blob and axis at once, in NumPy
+
+def cubic_interpolation(async_PTS, async_blobs, PTS):
+    # Not-a-knot cubic spline through the samples, the same curve as CubicSpline: a line for 2 samples, a parabola for 3
+    # - Samples shaped (n, ...), the spline of every trailing element is fitted and evaluated at PTS at once
+    x = np.asarray(async_PTS, dtype=np.float64)
+    y = np.asarray(async_blobs, dtype=np.float64).reshape(x.size, -1)
+    t = np.asarray(PTS, dtype=np.float64)[:, None]
+
+    n = x.size
+    h = np.diff(x)
+    slopes = np.diff(y, axis=0) / h[:, None]
+
+    if n == 2:
+        interpolated = y[0] + slopes[0] * (t - x[0])
+
+    elif n == 3:
+        # Newton form of the parabola
+        curvature = (slopes[1] - slopes[0]) / (x[2] - x[0])
+        interpolated = y[0] + (t - x[0]) * (slopes[0] + curvature * (t - x[1]))
+
+    else:
+        # Derivatives at the samples, shared system for every trailing element
+        A = np.zeros((n, n))
+        b = np.zeros((n, y.shape[1]))
+
+        i = np.arange(1, n - 1)
+        A[i, i - 1] = h[1:]
+        A[i, i] = 2 * (h[:-1] + h[1:])
+        A[i, i + 1] = h[:-1]
+        b[1:-1] = 3 * (h[1:, None] * slopes[:-1] + h[:-1, None] * slopes[1:])
+
+        # Not-a-knot: third derivative is continuous at the second and second to last samples
+        A[0, :2] = h[1], h[0] + h[1]
+        b[0] = ((h[0] + 2 * (h[0] + h[1])) * h[1] * slopes[0] + h[0] ** 2 * slopes[1]) / (h[0] + h[1])
+
+        A[-1, -2:] = h[-1] + h[-2], h[-2]
+        b[-1] = (h[-1] ** 2 * slopes[-2] + (2 * (h[-2] + h[-1]) + h[-1]) * h[-2] * slopes[-1]) / (h[-2] + h[-1])
+
+        derivatives = np.linalg.solve(A, b)
+
+        # Cubic Hermite piece of each PTS, the end pieces extrapolate
+        piece = np.clip(np.searchsorted(x, t[:, 0], side='right') - 1, 0, n - 2)
+        dt = t - x[piece, None]
+        h_piece = h[piece, None]
+
+        c_1 = derivatives[piece]
+        c_2 = (3 * slopes[piece] - 2 * c_1 - derivatives[piece + 1]) / h_piece
+        c_3 = (c_1 + derivatives[piece + 1] - 2 * slopes[piece]) / h_piece ** 2
+
+        interpolated = y[piece] + dt * (c_1 + dt * (c_2 + dt * c_3))
+
+    return interpolated.reshape((t.shape[0],) + np.shape(async_blobs)[1:])
+
 # Data structure for data interpolation
 class Synchronizer:
     def __init__(self, 
                  blob_count=1, # Number of expected blobs for interpolation
                  window=3,  # The minimum ammount of data points for interpolating 
                  step=0.05, # Time step for interpolation in seconds
-                 capture_time=10 # Capture time in seconds
+                 capture_time=10, # Capture time in seconds
+                 history=None, # Raw samples kept, at least the window (the whole capture if None)
+                 interpolation='scipy', # Interpolation method (see interpolation_methods)
+                 prediction=0 # Synchronized PTS extrapolated past the last received PTS, replaced once interpolated (0 disables)
                  ):
+
+        if interpolation not in interpolation_methods:
+            raise ValueError(f'Unknown interpolation {interpolation}, expected one of {interpolation_methods}')
         
         # Initializing interpolation parameters
         self.blob_count = blob_count
         self.interpolation_window = window
         self.step = step
         self.capture_time = capture_time
+        self.interpolation = interpolation
+        self.prediction = prediction
         self.interpolation_start = 0
 
         # Raw data - how it comes from the clients
-        self.async_PTS = []
-        self.async_blobs = []
+        self.history = history if history is None else max(history, window)
+        self.allocate()
 
         # Interpolated data - how it should be triangulated
         self.sync_PTS = np.arange(0.0, self.capture_time, self.step)
         self.sync_blobs = np.full((self.sync_PTS.size, blob_count, 2), -1.0) # Non-interpolated blobs are negative
+        self.sync_predicted = np.zeros(self.sync_PTS.size, dtype=bool) # Extrapolated blobs, not final yet
+
+    def __setstate__(self, state):
+        # Older pickles stored the raw data as lists
+        async_PTS, async_blobs = state.pop('async_PTS', None), state.pop('async_blobs', None)
+
+        self.interpolation = 'scipy'
+        self.prediction = 0
+        self.__dict__.update(state)
+
+        if 'sync_predicted' not in state:
+            self.sync_predicted = np.zeros(self.sync_PTS.size, dtype=bool)
+
+        if async_PTS is not None:
+            self.history = None
+            self.load_history(async_PTS, async_blobs)
+
+    def allocate(self, capacity=64):
+        # Raw samples in preallocated buffers
+        # - Bounded history: ring buffer where every sample is also written one capacity ahead, so any window is a contiguous view
+        # - Whole capture: buffers doubled when full
+        if self.history is not None:
+            capacity = 2 * self.history
+
+        self.PTS_buffer = np.zeros(capacity)
+        self.blobs_buffer = np.zeros((capacity, self.blob_count, 2))
+        self.count = 0 # Samples added so far
+
+    def append(self, blobs, PTS):
+        if self.history is not None:
+            slot = self.count % self.history
+
+            self.PTS_buffer[[slot, slot + self.history]] = PTS
+            self.blobs_buffer[[slot, slot + self.history]] = blobs
+
+        else:
+            # Amortized O(1) growth
+            if self.count == self.PTS_buffer.size:
+                self.PTS_buffer = np.concatenate((self.PTS_buffer, np.zeros_like(self.PTS_buffer)))
+                self.blobs_buffer = np.concatenate((self.blobs_buffer, np.zeros_like(self.blobs_buffer)))
+
+            self.PTS_buffer[self.count] = PTS
+            self.blobs_buffer[self.count] = blobs
+
+        self.count += 1
+
+    def window(self, size):
+        # Views of the last raw samples, oldest first, without copying
+        size = min(size, self.count)
+        end = self.count if self.history is None else (self.count - 1) % self.history + self.history + 1
+
+        return self.PTS_buffer[end - size:end], self.blobs_buffer[end - size:end]
+
+    @property
+    def async_PTS(self):
+        # Raw PTS kept, oldest first
+        return self.window(self.count if self.history is None else self.history)[0].copy()
+
+    @property
+    def async_blobs(self):
+        # Raw blobs kept in the order of the first message, oldest first (e.g. wand blobs for calibration)
+        return self.window(self.count if self.history is None else self.history)[1].copy()
+
+    def load_history(self, async_PTS, async_blobs):
+        # Replace the raw samples, e.g. with a history synchronized elsewhere
+        self.allocate(max(64, len(async_PTS)))
+
+        for PTS, blobs in zip(async_PTS, async_blobs):
+            self.append(blobs, PTS)
        
     def add_data(self, blobs, PTS):
         # Do not add data if PTS is out of recording range
@@ -42,49 +175,57 @@ class Synchronizer:
             return False # Data refused
 
         # Check if it's not empty
-        if self.async_PTS:
+        if self.count:
+            last_PTS, last_blobs = self.window(1)
+
             # Do not add data if incoming PTS is lesser or equal than the last PTS added
             # - Assure strictly ascending order of time
             # - Avoid sequenced repeated messaging
-            if PTS <= self.async_PTS[-1]:
+            if PTS <= last_PTS[0]:
                 return False # Data refused
 
-        # Ordering blobs of this message by their proximity to the others on the previous message 
-        if self.async_blobs: # If there are blobs
-            # Try to order blobs
-            ordered_blobs = proximity_order(self.async_blobs[-1], blobs)
-
-            self.async_blobs.append(ordered_blobs)
-            self.async_PTS.append(PTS)
+            # Ordering blobs of this message by their proximity to the others on the previous message 
+            self.append(proximity_order(last_blobs[0], blobs), PTS)
 
         else: # If there aren't any blobs, just add them
-            self.async_blobs.append(blobs)
-            self.async_PTS.append(PTS)
+            self.append(blobs, PTS)
 
         # Enough points to interpolate in the same blob ordering?
-        if len(self.async_PTS) >= self.interpolation_window:
+        if self.count >= self.interpolation_window:
             # Get the window last blob coordinate data
-            async_PTS = np.array(self.async_PTS[-self.interpolation_window:])
-            async_blobs = np.array(self.async_blobs[-self.interpolation_window:])
+            async_PTS, async_blobs = self.window(self.interpolation_window)
             
             start = self.interpolation_start    # Start index of interpolated PTS  
             end = int(async_PTS[-1] // self.step) # Final index of interpolated PTS  
 
-            for blob in range(self.blob_count):
-                # Extracting blob coordinate history in the interpolation window
-                # The slicing works like: async_blob = async_blobs[PTS, blob, axis]
-                async_blob = async_blobs[:, blob, :]
+            stop = end + 1 + self.prediction    # End of predicted PTS (exclusive)
 
-                # Generating a cubic spline that represents blob trajectory 
-                blob_trajectory = CubicSpline(async_PTS, async_blob)
-                
-                # Get blob tracjectory in the interpolated timestamps that are not yet interpolated
-                interpolated_blob = blob_trajectory(self.sync_PTS[start:end+1]) # End of slice is exclusive!
-
-                # Add interpolated blobs to data structure
-                self.sync_blobs[start:end+1, blob, :] = interpolated_blob
+            # Interpolated PTS are final, the following ones are extrapolated from the same window until then
+            self.sync_blobs[start:stop] = self.interpolate_blobs(async_PTS, async_blobs, self.sync_PTS[start:stop])
+            self.sync_predicted[start:end+1] = False
+            self.sync_predicted[end+1:stop] = True
 
             # Updating interpolation start to the next PTS 
             self.interpolation_start = end + 1
 
-        return True # Data accepted
\ No newline at end of file
+        return True # Data accepted
+
+    def interpolate_blobs(self, async_PTS, async_blobs, PTS):
+        # Blob trajectories of the window evaluated at PTS, shaped (PTS, blob_count, 2)
+        if self.interpolation == 'closed_form':
+            return cubic_interpolation(async_PTS, async_blobs, PTS)
+
+        interpolated_blobs = np.empty((len(PTS), self.blob_count, 2))
+
+        for blob in range(self.blob_count):
+            # Extracting blob coordinate history in the interpolation window
+            # The slicing works like: async_blob = async_blobs[PTS, blob, axis]
+            async_blob = async_blobs[:, blob, :]
+
+            # Generating a cubic spline that represents blob trajectory 
+            blob_trajectory = CubicSpline(async_PTS, async_blob)
+            
+            # Get blob tracjectory in the interpolated timestamps that are not yet interpolated
+            interpolated_blobs[:, blob, :] = blob_trajectory(PTS)
+
+        return interpolated_blobs
\ No newline at end of file